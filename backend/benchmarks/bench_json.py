@@ -0,0 +1,62 @@
+"""
+bench_json.py
+    compares the JSON providers on question list payloads of 10, 1,000 and
+    100,000 questions, the way the API serializes them.
+
+    python benchmarks/bench_json.py [--repeat N]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from flaskr.json_provider import json_providers
+
+SIZES = (10, 1000, 100000)
+
+
+def payload(size):
+    questions = [{
+        'id': question_id,
+        'question': f'Which planet is number {question_id} in this list of questions?',
+        'answer': f'Answer {question_id}',
+        'category': question_id % 6 + 1,
+        'difficulty': question_id % 5 + 1
+    } for question_id in range(1, size + 1)]
+    return {
+        'success': True,
+        'questions': questions,
+        'total_questions': size,
+        'categories': {category: f'Category {category}' for category in range(1, 7)},
+        'current_category': None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='runs per measurement, the best one is kept')
+    args = parser.parse_args()
+
+    print(f"{'provider':<10}{'questions':>12}{'dumps ms':>12}{'response ms':>14}{'bytes':>12}")
+    for size in SIZES:
+        data = payload(size)
+        number = max(1, 10000 // size)
+        for name, provider_class in json_providers.items():
+            app = Flask(__name__)
+            app.json = provider_class(app)
+            with app.app_context():
+                dumps = min(timeit.repeat(lambda: app.json.dumps(data), number=number, repeat=args.repeat))
+                response = min(timeit.repeat(lambda: app.json.response(data), number=number, repeat=args.repeat))
+                length = len(app.json.response(data).get_data())
+            print(f'{name:<10}{size:>12}{dumps / number * 1000:>12.3f}{response / number * 1000:>14.3f}{length:>12}')
+
+    if 'orjson' not in json_providers:
+        print('orjson is not installed, only the stdlib provider was measured.')
+
+
+if __name__ == '__main__':
+    main()
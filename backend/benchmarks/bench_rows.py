@@ -0,0 +1,82 @@
+"""
+bench_rows.py
+    compares loading questions as ORM instances and calling format() with
+    loading them as FORMATTED_QUESTION dicts, on an in-memory SQLite
+    database of 10, 1,000 and 100,000 questions. Reports the best time of
+    each and the peak memory allocated while loading.
+
+    python benchmarks/bench_rows.py [--repeat N]
+"""
+import argparse
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flaskr import create_app
+from models import db, Question, Category, FORMATTED_QUESTION
+
+SIZES = (10, 1000, 100000)
+
+
+def load_instances():
+    questions = Question.query.order_by(Question.id).all()
+    result = [question.format() for question in questions]
+    db.session.expunge_all()
+    return result
+
+
+def load_dicts():
+    return Question.query.order_by(Question.id).with_entities(FORMATTED_QUESTION).all()
+
+
+STRATEGIES = {
+    'orm': load_instances,
+    'bundle': load_dicts,
+}
+
+
+def seed(size):
+    db.session.query(Question).delete()
+    db.session.execute(Question.__table__.insert(), [{
+        'question': f'Which planet is number {question_id} in this list of questions?',
+        'answer': f'Answer {question_id}',
+        'category': question_id % 6 + 1,
+        'difficulty': question_id % 5 + 1
+    } for question_id in range(1, size + 1)])
+    db.session.commit()
+
+
+def peak_allocation(function):
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='runs per measurement, the best one is kept')
+    args = parser.parse_args()
+
+    app = create_app({'DATABASE_URL': 'sqlite://'})
+    with app.app_context():
+        db.create_all(bind_key=None)
+        db.session.add_all(Category(type=f'Category {category}') for category in range(1, 7))
+        db.session.commit()
+
+        print(f"{'strategy':<10}{'questions':>12}{'load ms':>12}{'peak KiB':>12}")
+        for size in SIZES:
+            seed(size)
+            number = max(1, 1000 // size)
+            for name, strategy in STRATEGIES.items():
+                elapsed = min(timeit.repeat(strategy, number=number, repeat=args.repeat))
+                peak = peak_allocation(strategy)
+                print(f'{name:<10}{size:>12}{elapsed / number * 1000:>12.3f}{peak / 1024:>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+import os
+import threading
+import time
+from sqlalchemy.pool import QueuePool
+
+# Upper bounds, in seconds, of the connection checkout wait histogram.
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+
+
+"""
+pool_options(database_path)
+    returns the SQLAlchemy engine options of the connection pool, read from
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE and
+    DB_POOL_PRE_PING. SQLite keeps the pool Flask-SQLAlchemy picks for it.
+"""
+def pool_options(database_path):
+    if database_path.startswith('sqlite'):
+        return {}
+    return {
+        'poolclass': TimedQueuePool,
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes'),
+    }
+
+
+"""
+WaitHistogram
+    cumulative histogram of the time spent waiting for a connection
+"""
+class WaitHistogram:
+
+    def __init__(self, buckets=WAIT_BUCKETS):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        with self._lock:
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    self.counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+
+
+"""
+TimedQueuePool
+    a QueuePool that records how long every checkout waited for a
+    connection, including the time to open a new one.
+"""
+class TimedQueuePool(QueuePool):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_times = WaitHistogram()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.wait_times.observe(time.perf_counter() - start)
@@ -0,0 +1,63 @@
+import random
+from contextlib import contextmanager
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+from db_pool import pool_options
+
+REPLICA_BIND_PREFIX = 'replica_'
+
+
+"""
+replica_binds(replica_paths)
+    returns the SQLALCHEMY_BINDS entries of the read replicas, one bind key
+    per URL, each with the same pool settings as the primary.
+"""
+def replica_binds(replica_paths):
+    return {
+        f'{REPLICA_BIND_PREFIX}{index}': dict(pool_options(path), url=path)
+        for index, path in enumerate(replica_paths)
+    }
+
+
+"""
+RoutingSession
+    a session that sends the reads of a transaction to a read replica once
+    use_replica() was called on it. Flushes and INSERT, UPDATE and DELETE
+    statements always go to the primary, and after the first of them the
+    rest of the session reads from the primary too, so it sees its own
+    writes. Without a replica every statement goes to the primary.
+    Caches shared by every client load inside primary(), so they never
+    hold data older than what a client that just wrote expects to read.
+"""
+class RoutingSession(Session):
+
+    @property
+    def replica(self):
+        return self.info.get('replica')
+
+    def use_replica(self):
+        keys = [key for key in self._db.engines if key and key.startswith(REPLICA_BIND_PREFIX)]
+        if keys:
+            self.info['replica'] = random.choice(keys)
+
+    def use_primary(self):
+        self.info.pop('replica', None)
+
+    @contextmanager
+    def primary(self):
+        replica = self.info.pop('replica', None)
+        try:
+            yield
+        finally:
+            if replica is not None:
+                self.info['replica'] = replica
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = self.info.get('replica')
+        if replica is not None and bind is None:
+            if self._flushing or isinstance(clause, UpdateBase):
+                self.use_primary()
+            else:
+                return self._db.engines[replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
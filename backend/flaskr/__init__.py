@@ -1,28 +1,123 @@
 import os
-from flask import Flask, request, abort, jsonify
+import click
+from flask import Flask, request, abort, jsonify, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
-
-from models import setup_db, Question, Category
+import base64
+import binascii
+
+from models import db, setup_db, init_db, database_path, Question, Category, QuestionCount, QuizSession, FORMATTED_QUESTION
+from .category_cache import category_cache, CATEGORY_CACHE_TTL
+from .quiz_selector import quiz_selector, QUIZ_INDEX_TTL
+from .search import search_questions as find_questions, search_backends, SEARCH_BACKEND, SEARCH_TRIGRAM_THRESHOLD, \
+    SEARCH_MAX_PAGE_SIZE, SEARCH_COUNT_LIMIT
+from .suggest import suggestion_index, SUGGEST_INDEX_TTL
+from .search_index import search_index, SEARCH_INDEX_TTL
+from .search_cache import search_cache, normalize, SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL
+from .data_version import data_version
+from .export import export_lines, EXPORT_MIMETYPES, EXPORT_BATCH_SIZE
+from .bulk import parse_questions, import_questions, ImportFormatError, IMPORT_FORMATS, IMPORT_BATCH_SIZE, \
+    question_filters, delete_questions
+from .group_commit import write_queue, GroupCommitTimeout, GROUP_COMMIT_MAX_DELAY, GROUP_COMMIT_MAX_BATCH, \
+    GROUP_COMMIT_TIMEOUT
+from . import metrics, pool_metrics
+from .etag import conditional, revision_cache, ETAG_REVISION_TTL
+from .compression import compression, CompressedBody, COMPRESS_MIN_SIZE, COMPRESS_LEVEL
+from .json_provider import json_provider, json_providers, dumps_bytes, JSON_BACKEND
+from .replicas import reads_from_replica, replica_stickiness, REPLICA_STICKINESS
 
 QUESTIONS_PER_PAGE = 10
+QUIZ_SESSION_TTL = 86400
+SUGGESTIONS_PER_PREFIX = 10
+MAX_SUGGESTIONS_PER_PREFIX = 25
 
-def paginate_questions(request, all_questions):
+def paginate_questions(request, selection):
     page = request.args.get('page', 1, type=int)
-    start = (page - 1) * QUESTIONS_PER_PAGE
-    end = start + QUESTIONS_PER_PAGE
+    start = (max(page, 1) - 1) * QUESTIONS_PER_PAGE
+
+    # Let the database do the slicing so only one page of rows is loaded,
+    # straight into response dicts.
+    return selection.with_entities(FORMATTED_QUESTION).order_by(
+        Question.id).offset(start).limit(QUESTIONS_PER_PAGE).all()
+
+
+def encode_cursor(question_id):
+    return base64.urlsafe_b64encode(str(question_id).encode()).decode()
+
 
-    questions = [question.format() for question in all_questions]
-    current_questions = questions[start:end]
+def decode_cursor(cursor):
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, binascii.Error):
+        abort(400)
 
-    return current_questions
+
+def paginate_questions_after(request, selection):
+    # Keyset pagination: seek past the last seen primary key instead of
+    # skipping rows, so every page costs the same regardless of depth.
+    if 'cursor' in request.args:
+        after_id = decode_cursor(request.args['cursor'])
+    else:
+        after_id = request.args.get('after_id', 0, type=int)
+
+    rows = selection.filter(Question.id > after_id).with_entities(FORMATTED_QUESTION).order_by(
+        Question.id).limit(QUESTIONS_PER_PAGE + 1).all()
+    current_questions = rows[:QUESTIONS_PER_PAGE]
+
+    next_cursor = None
+    if len(rows) > QUESTIONS_PER_PAGE:
+        next_cursor = encode_cursor(current_questions[-1]['id'])
+
+    return current_questions, next_cursor
 
 
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
-    setup_db(app)
+    app.config.from_mapping(
+        DATABASE_URL=os.environ.get('DATABASE_URL', database_path),
+        DATABASE_REPLICA_URLS=[url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()],
+        REPLICA_STICKINESS=float(os.environ.get('REPLICA_STICKINESS', REPLICA_STICKINESS)),
+        CATEGORY_CACHE_TTL=float(os.environ.get('CATEGORY_CACHE_TTL', CATEGORY_CACHE_TTL)),
+        QUIZ_INDEX_TTL=float(os.environ.get('QUIZ_INDEX_TTL', QUIZ_INDEX_TTL)),
+        QUIZ_SESSION_TTL=float(os.environ.get('QUIZ_SESSION_TTL', QUIZ_SESSION_TTL)),
+        SUGGEST_INDEX_TTL=float(os.environ.get('SUGGEST_INDEX_TTL', SUGGEST_INDEX_TTL)),
+        SEARCH_INDEX_TTL=float(os.environ.get('SEARCH_INDEX_TTL', SEARCH_INDEX_TTL)),
+        SEARCH_BACKEND=os.environ.get('SEARCH_BACKEND', SEARCH_BACKEND),
+        SEARCH_TRIGRAM_THRESHOLD=float(os.environ.get('SEARCH_TRIGRAM_THRESHOLD', SEARCH_TRIGRAM_THRESHOLD)),
+        SEARCH_MAX_PAGE_SIZE=int(os.environ.get('SEARCH_MAX_PAGE_SIZE', SEARCH_MAX_PAGE_SIZE)),
+        SEARCH_COUNT_LIMIT=int(os.environ.get('SEARCH_COUNT_LIMIT', SEARCH_COUNT_LIMIT)),
+        SEARCH_CACHE_SIZE=int(os.environ.get('SEARCH_CACHE_SIZE', SEARCH_CACHE_SIZE)),
+        SEARCH_CACHE_TTL=float(os.environ.get('SEARCH_CACHE_TTL', SEARCH_CACHE_TTL)),
+        IMPORT_BATCH_SIZE=int(os.environ.get('IMPORT_BATCH_SIZE', IMPORT_BATCH_SIZE)),
+        ETAG_REVISION_TTL=float(os.environ.get('ETAG_REVISION_TTL', ETAG_REVISION_TTL)),
+        GROUP_COMMIT=os.environ.get('GROUP_COMMIT', '').lower() in ('1', 'true', 'yes'),
+        GROUP_COMMIT_MAX_DELAY=float(os.environ.get('GROUP_COMMIT_MAX_DELAY', GROUP_COMMIT_MAX_DELAY)),
+        GROUP_COMMIT_MAX_BATCH=int(os.environ.get('GROUP_COMMIT_MAX_BATCH', GROUP_COMMIT_MAX_BATCH)),
+        GROUP_COMMIT_TIMEOUT=float(os.environ.get('GROUP_COMMIT_TIMEOUT', GROUP_COMMIT_TIMEOUT)),
+        COMPRESS_MIN_SIZE=int(os.environ.get('COMPRESS_MIN_SIZE', COMPRESS_MIN_SIZE)),
+        COMPRESS_LEVEL=int(os.environ.get('COMPRESS_LEVEL', COMPRESS_LEVEL)),
+        JSON_BACKEND=os.environ.get('JSON_BACKEND', JSON_BACKEND),
+    )
+    if test_config is not None:
+        app.config.from_mapping(test_config)
+    if app.config['SEARCH_BACKEND'] not in search_backends:
+        raise ValueError(f"Unknown SEARCH_BACKEND {app.config['SEARCH_BACKEND']!r}")
+    if app.config['JSON_BACKEND'] != 'auto' and app.config['JSON_BACKEND'] not in json_providers:
+        raise ValueError(f"Unknown JSON_BACKEND {app.config['JSON_BACKEND']!r}")
+    app.json = json_provider(app.config['JSON_BACKEND'])(app)
+    # No connection is opened here, the pool connects on first use.
+    setup_db(app, app.config['DATABASE_URL'], app.config['DATABASE_REPLICA_URLS'])
+    category_cache.ttl = app.config['CATEGORY_CACHE_TTL']
+    quiz_selector.ttl = app.config['QUIZ_INDEX_TTL']
+    suggestion_index.ttl = app.config['SUGGEST_INDEX_TTL']
+    search_index.ttl = app.config['SEARCH_INDEX_TTL']
+    search_cache.size = app.config['SEARCH_CACHE_SIZE']
+    search_cache.ttl = app.config['SEARCH_CACHE_TTL']
+    write_queue.init_app(app)
+    revision_cache.ttl = app.config['ETAG_REVISION_TTL']
+    compression.init_app(app)
+    replica_stickiness.init_app(app)
 
     CORS(app)
 
@@ -35,16 +130,14 @@ def create_app(test_config=None):
 
 
     @app.route('/categories')
+    @reads_from_replica
+    @conditional
     def get_categories():
-        categories = Category.query.order_by(Category.type).all()
-
-        if len(categories) == 0:
+        if len(category_cache.categories()) == 0:
             abort(404)
 
-        return jsonify({
-            'success': True,
-            'categories': {category.id: category.type for category in categories}
-        })
+        # The body is serialized and compressed once per cache refresh, not per request.
+        return compression.respond(category_cache.body(), 'application/json')
 
     # Add capability to create new categories.
     @app.route("/categories", methods=['POST'])
@@ -58,37 +151,84 @@ def create_app(test_config=None):
 
         try:
             category = Category(type=category_type)
-            category.insert()
+            write_queue.insert(category)
 
             return jsonify({
                 'success': True,
                 'created': category.id,
             })
 
+        except GroupCommitTimeout:
+            abort(503)
         except:
             abort(422)
 
 
 
     @app.route('/questions')
+    @reads_from_replica
+    @conditional
     def list_questions():
-        all_questions = Question.query.all()
-        questions = paginate_questions(request, all_questions)
+        selection = Question.query
+        total_questions = QuestionCount.total_for()
+
+        if 'cursor' in request.args or 'after_id' in request.args:
+            questions, next_cursor = paginate_questions_after(request, selection)
+        else:
+            questions = paginate_questions(request, selection)
+            page = max(request.args.get('page', 1, type=int), 1)
+            next_cursor = None
+            if questions and page * QUESTIONS_PER_PAGE < total_questions:
+                next_cursor = encode_cursor(questions[-1]['id'])
 
         if len(questions) == 0:
             abort(404)
-        all_categories = Category.query.all()
-        categories = {category.id: category.type for category in all_categories}
+        categories = category_cache.categories()
 
         return jsonify({
             'success': True,
             'questions': questions,
-            'total_questions': len(all_questions),
+            'total_questions': total_questions,
             'categories': categories,
-            'current_category': None
+            'current_category': None,
+            'next_cursor': next_cursor
         })
 
 
+    @app.route('/questions/export')
+    @reads_from_replica
+    def export_questions():
+        export_format = request.args.get('format', 'ndjson')
+        category = request.args.get('category', type=int)
+        difficulty = request.args.get('difficulty', type=int)
+
+        if export_format not in EXPORT_MIMETYPES:
+            abort(400)
+        # type=int drops values it cannot parse, which would export every row.
+        if (category is None and 'category' in request.args) or \
+                (difficulty is None and 'difficulty' in request.args):
+            abort(400)
+
+        selection = Question.query
+        if category is not None:
+            selection = selection.filter(Question.category == category)
+        if difficulty is not None:
+            selection = selection.filter(Question.difficulty == difficulty)
+
+        # yield_per streams rows through a server side cursor, one batch at a time.
+        # The query is executed here, on the replica, and read while streaming.
+        selection = selection.with_entities(FORMATTED_QUESTION).order_by(Question.id)
+        questions = db.session.execute(
+            selection.statement, execution_options={'yield_per': EXPORT_BATCH_SIZE}).scalars()
+
+        chunks, headers = compression.stream(export_lines(questions, export_format))
+        headers['Content-Disposition'] = f'attachment; filename=questions.{export_format}'
+
+        return app.response_class(
+            stream_with_context(chunks),
+            mimetype=EXPORT_MIMETYPES[export_format],
+            headers=headers)
+
     @app.route("/questions/<question_id>", methods=['DELETE'])
     def delete_question(question_id):
         try:
@@ -101,6 +241,22 @@ def create_app(test_config=None):
         except:
             abort(422)
 
+    @app.route("/questions", methods=['DELETE'])
+    def delete_questions_in_bulk():
+        body = request.get_json(silent=True)
+
+        try:
+            conditions = question_filters(body or {})
+        except ValueError:
+            abort(422)
+
+        deleted = delete_questions(conditions)
+
+        return jsonify({
+            'success': True,
+            'deleted': deleted
+        })
+
     @app.route("/questions", methods=['POST'])
     def store_question():
         body = request.get_json()
@@ -115,51 +271,124 @@ def create_app(test_config=None):
 
         try:
             question = Question(question=get_question, answer=get_answer,
-                                difficulty=get_difficulty, category=get_category)
-            question.insert()
+                                difficulty=get_difficulty, category=int(get_category))
+            write_queue.insert(question)
 
             return jsonify({
                 'success': True,
                 'created': question.id,
             })
 
+        except GroupCommitTimeout:
+            abort(503)
         except:
             abort(422)
 
+    @app.route('/questions/bulk', methods=['POST'])
+    def import_questions_in_bulk():
+        import_format = IMPORT_FORMATS.get(request.mimetype)
+
+        if import_format is None:
+            abort(400)
+
+        try:
+            rows = parse_questions(request.get_data(as_text=True), import_format)
+        except ImportFormatError:
+            abort(400)
+
+        created, errors = import_questions(rows, app.config['IMPORT_BATCH_SIZE'])
+
+        return jsonify({
+            'success': True,
+            'created': created,
+            'errors': errors
+        })
+
     @app.route('/questions/search', methods=['POST'])
+    @reads_from_replica
     def search_questions():
         body = request.get_json()
         search_keyword = body.get('searchTerm', None)
 
-        if search_keyword:
-            search_results = Question.query.filter(
-                Question.question.ilike(f'%{search_keyword}%')).all()
+        # Numbers are searched as their text, like any other term.
+        if isinstance(search_keyword, (int, float)) and not isinstance(search_keyword, bool):
+            search_keyword = str(search_keyword)
+        elif search_keyword and not isinstance(search_keyword, str):
+            abort(400)
 
-            return jsonify({
-                'success': True,
-                'questions': [question.format() for question in search_results],
-                'total_questions': len(search_results),
-                'current_category': None
-            })
+        if search_keyword:
+            try:
+                page = max(int(body.get('page', request.args.get('page', 1))), 1)
+                limit = int(body.get('limit', request.args.get('limit', QUESTIONS_PER_PAGE)))
+            except (TypeError, ValueError):
+                abort(400)
+
+            # Never let one broad term serialize the whole table.
+            limit = min(max(limit, 1), app.config['SEARCH_MAX_PAGE_SIZE'])
+            offset = (page - 1) * limit
+            count_limit = app.config['SEARCH_COUNT_LIMIT']
+
+            # Replicas may lag, their results are cached apart from the primary's.
+            key = (app.config['SEARCH_BACKEND'], normalize(search_keyword), offset, limit, db.session().replica)
+            body = search_cache.get(key)
+
+            if body is None:
+                version = data_version.value
+                total_questions, search_results = find_questions(
+                    search_keyword, app.config['SEARCH_BACKEND'], offset, limit, count_limit)
+                body = CompressedBody(dumps_bytes({
+                    'success': True,
+                    'questions': search_results,
+                    'total_questions': min(total_questions, count_limit),
+                    'total_questions_estimated': total_questions > count_limit,
+                    'current_category': None
+                }))
+                search_cache.put(key, body, version)
+
+            return compression.respond(body, 'application/json')
         abort(404)
 
+    @app.route('/questions/suggest')
+    @reads_from_replica
+    def suggest_questions():
+        prefix = request.args.get('prefix', '').strip()
+        limit = request.args.get('limit', SUGGESTIONS_PER_PREFIX, type=int)
+
+        if not prefix:
+            abort(422)
+
+        ids = suggestion_index.suggest(prefix, min(max(limit, 1), MAX_SUGGESTIONS_PER_PREFIX))
+        questions = {question.id: question for question in
+                     Question.query.filter(Question.id.in_(ids)).all()} if ids else {}
+
+        return jsonify({
+            'success': True,
+            'suggestions': [{
+                'id': question_id,
+                'question': questions[question_id].question
+            } for question_id in ids if question_id in questions]
+        })
+
     @app.route('/categories/<int:category_id>/questions', methods=['GET'])
+    @reads_from_replica
+    @conditional
     def get_question_categories(category_id):
 
         try:
             questions = Question.query.filter(
-                Question.category == str(category_id)).all()
+                Question.category == category_id).with_entities(FORMATTED_QUESTION).all()
 
             return jsonify({
                 'success': True,
-                'questions': [question.format() for question in questions],
-                'total_questions': len(questions),
+                'questions': questions,
+                'total_questions': QuestionCount.total_for(category_id),
                 'current_category': category_id
             })
         except:
             abort(404)
 
     @app.route('/quizzes', methods=['POST'])
+    @reads_from_replica
     def quiz():
 
         try:
@@ -170,12 +399,11 @@ def create_app(test_config=None):
             quiz_category = body.get('quiz_category')
             previous_questions = body.get('previous_questions')
 
-            if (quiz_category['id'] == 0):
-                questions = Question.query.filter(Question.id.notin_((previous_questions))).all()
-            else:
-                questions = Question.query.filter_by(category=quiz_category['id']).filter(Question.id.notin_((previous_questions))).all()
+            question = quiz_selector.next_question(quiz_category['id'], set(previous_questions))
+            if question is None:
+                abort(422)
 
-            random_new_question = questions[random.randrange(0, len(questions))].format()
+            random_new_question = question.format()
 
             return jsonify({
                 'success': True,
@@ -184,6 +412,101 @@ def create_app(test_config=None):
         except:
             abort(422)
 
+    @app.route('/quizzes/sessions', methods=['POST'])
+    def start_quiz_session():
+        body = request.get_json()
+
+        try:
+            quiz_category = body.get('quiz_category')
+            session = QuizSession(category=int(quiz_category['id']))
+            session.shuffle()
+            # Abandoned games are never ended, drop them as new ones start.
+            QuizSession.delete_expired(app.config['QUIZ_SESSION_TTL'])
+            session.insert()
+
+            return jsonify({
+                'success': True,
+                'session_id': session.id
+            })
+        except:
+            abort(422)
+
+    @app.route('/quizzes/sessions/<session_id>/next', methods=['POST'])
+    def next_quiz_question(session_id):
+        # Lock the session row so concurrent turns cannot pop the same position.
+        session = QuizSession.query.filter(
+            QuizSession.id == session_id).with_for_update().one_or_none()
+
+        if session is None or session.expired(app.config['QUIZ_SESSION_TTL']):
+            abort(404)
+
+        question = None
+        while question is None:
+            question_id = session.next_question_id()
+            if question_id is None:
+                break
+            # Questions deleted since the deck was shuffled are skipped.
+            question = Question.query.get(question_id)
+        session.update()
+
+        return jsonify({
+            'success': True,
+            'question': question.format() if question is not None else None,
+            'served': session.position,
+            'total': session.size
+        })
+
+    @app.route('/quizzes/sessions/<session_id>', methods=['DELETE'])
+    def end_quiz_session(session_id):
+        session = QuizSession.query.get(session_id)
+
+        if session is None or session.expired(app.config['QUIZ_SESSION_TTL']):
+            abort(404)
+
+        session.delete()
+
+        return jsonify({
+            'success': True,
+            'deleted': session_id
+        })
+
+    @app.route('/metrics')
+    def get_metrics():
+        return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create the missing tables and backfill the question counters."""
+        init_db()
+        click.echo('Initialized the database.')
+
+    @app.cli.command('expire-quiz-sessions')
+    def expire_quiz_sessions_command():
+        """Delete the quiz sessions older than QUIZ_SESSION_TTL."""
+        deleted = QuizSession.delete_expired(app.config['QUIZ_SESSION_TTL'])
+        db.session.commit()
+        click.echo(f'{deleted} expired quiz sessions deleted')
+
+    @app.cli.command('import-questions')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'import_format', type=click.Choice(['json', 'ndjson', 'csv']),
+                  help='Defaults to the file extension.')
+    def import_questions_command(path, import_format):
+        """Import questions from a JSON array, NDJSON or CSV file."""
+        import_format = import_format or os.path.splitext(path)[1].lstrip('.').lower()
+
+        with open(path, encoding='utf-8', newline='') as source:
+            try:
+                rows = parse_questions(source.read(), import_format)
+            except ImportFormatError as error:
+                raise click.UsageError(str(error))
+
+        created, errors = import_questions(rows, app.config['IMPORT_BATCH_SIZE'])
+
+        for error in errors:
+            click.echo(f"row {error['row']}: {error['message']}", err=True)
+        click.echo(f'{created} questions imported, {len(errors)} rows skipped')
+
     @app.errorhandler(404)
     def not_found(error):
         return jsonify({
@@ -200,6 +523,14 @@ def create_app(test_config=None):
             "message": "unprocessable"
         }), 422
 
+    @app.errorhandler(503)
+    def service_unavailable(error):
+        return jsonify({
+            "success": False,
+            "error": 503,
+            "message": "service unavailable"
+        }), 503
+
     @app.errorhandler(400)
     def bad_request(error):
         return jsonify({
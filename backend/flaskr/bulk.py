@@ -0,0 +1,199 @@
+import csv
+import io
+from flask import json
+from sqlalchemy import delete, insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Question, Category, QuestionCount
+from .model_events import record_change
+
+IMPORT_BATCH_SIZE = 5000
+
+IMPORT_FORMATS = {
+    'application/json': 'json',
+    'application/x-ndjson': 'ndjson',
+    'text/csv': 'csv',
+}
+
+REQUIRED_FIELDS = ('question', 'answer', 'difficulty', 'category')
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def parse_questions(text, import_format):
+    """
+    parse_questions(text, import_format)
+        returns a list of (row number, row) pairs read from a JSON array,
+        NDJSON or CSV document. Rows that cannot be parsed are returned as
+        their error message instead of a dict.
+    """
+    if import_format == 'json':
+        try:
+            rows = json.loads(text)
+        except ValueError as error:
+            raise ImportFormatError(f'invalid JSON: {error}')
+        if not isinstance(rows, list):
+            raise ImportFormatError('expected a JSON array of questions')
+        return list(enumerate(rows, 1))
+
+    if import_format == 'ndjson':
+        rows = []
+        for number, line in enumerate(text.splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                rows.append((number, json.loads(line)))
+            except ValueError as error:
+                rows.append((number, f'invalid JSON: {error}'))
+        return rows
+
+    if import_format == 'csv':
+        return list(enumerate(csv.DictReader(io.StringIO(text)), 1))
+
+    raise ImportFormatError(f'unsupported format {import_format!r}')
+
+
+def validate_question(row, category_ids):
+    """
+    validate_question(row, category_ids)
+        returns the column values of a question row, checked like
+        store_question does, or raises ValueError with the reason.
+    """
+    if isinstance(row, str):
+        raise ValueError(row)
+    if not isinstance(row, dict):
+        raise ValueError('expected an object')
+    missing = [field for field in REQUIRED_FIELDS if row.get(field) in (None, '')]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+
+    try:
+        category = int(row['category'])
+        difficulty = int(row['difficulty'])
+    except (TypeError, ValueError):
+        raise ValueError('category and difficulty must be integers')
+    if category not in category_ids:
+        raise ValueError(f'unknown category {category}')
+
+    return {
+        'question': str(row['question']),
+        'answer': str(row['answer']),
+        'category': category,
+        'difficulty': difficulty,
+    }
+
+
+def _insert_batch(batch):
+    # executemany in one round trip; RETURNING gives the new ids back.
+    statement = insert(Question.__table__).returning(*Question.__table__.c)
+    rows = db.session.execute(statement, batch).mappings().all()
+
+    totals = {}
+    for row in rows:
+        totals[row['category']] = totals.get(row['category'], 0) + 1
+        record_change(db.session, Question, 'insert', dict(row))
+    for category, total in totals.items():
+        QuestionCount.adjust(category, total)
+    return len(rows)
+
+
+def import_questions(rows, batch_size=IMPORT_BATCH_SIZE):
+    """
+    import_questions(rows, batch_size)
+        validates and inserts (row number, row) pairs, committing once per
+        batch. Returns the number of questions created and a list of
+        {'row', 'message'} errors for the rows that were skipped.
+    """
+    category_ids = {category_id for category_id, in db.session.query(Category.id)}
+    created = 0
+    errors = []
+    batch = []
+
+    def flush(batch):
+        try:
+            inserted = _insert_batch([values for number, values in batch])
+            db.session.commit()
+            return inserted
+        except SQLAlchemyError:
+            db.session.rollback()
+
+        # Retry the failed batch row by row so one bad row does not cost the others.
+        inserted = 0
+        for number, values in batch:
+            try:
+                inserted += _insert_batch([values])
+                db.session.commit()
+            except SQLAlchemyError as error:
+                db.session.rollback()
+                errors.append({'row': number, 'message': str(getattr(error, 'orig', None) or error).strip()})
+        return inserted
+
+    for number, row in rows:
+        try:
+            batch.append((number, validate_question(row, category_ids)))
+        except ValueError as error:
+            errors.append({'row': number, 'message': str(error)})
+            continue
+        if len(batch) >= batch_size:
+            created += flush(batch)
+            batch = []
+
+    if batch:
+        created += flush(batch)
+
+    return created, sorted(errors, key=lambda error: error['row'])
+
+
+def question_filters(body):
+    """
+    question_filters(body)
+        returns the conditions selecting the questions described by a bulk
+        request body: a list of ids and/or category, difficulty, min_id and
+        max_id. Raises ValueError when the body selects nothing explicitly.
+    """
+    table = Question.__table__
+    conditions = []
+    try:
+        if 'ids' in body:
+            conditions.append(table.c.id.in_([int(question_id) for question_id in body['ids']]))
+        if 'category' in body:
+            conditions.append(table.c.category == int(body['category']))
+        if 'difficulty' in body:
+            conditions.append(table.c.difficulty == int(body['difficulty']))
+        if 'min_id' in body:
+            conditions.append(table.c.id >= int(body['min_id']))
+        if 'max_id' in body:
+            conditions.append(table.c.id <= int(body['max_id']))
+    except (TypeError, ValueError):
+        raise ValueError('ids, category, difficulty, min_id and max_id must be integers')
+
+    if not conditions:
+        raise ValueError('no questions selected')
+    return conditions
+
+
+def delete_questions(conditions):
+    """
+    delete_questions(conditions)
+        deletes every question matching all conditions with a single
+        DELETE ... WHERE and returns how many were deleted.
+        The deleted ids are reported as one change, so the in-memory indexes
+        drop them in a single pass instead of one pass per row.
+    """
+    table = Question.__table__
+    statement = delete(table).where(*conditions).returning(table.c.id, table.c.category)
+
+    ids = set()
+    totals = {}
+    for question_id, category in db.session.execute(statement):
+        ids.add(question_id)
+        totals[category] = totals.get(category, 0) + 1
+    for category, total in totals.items():
+        QuestionCount.adjust(category, -total)
+    if ids:
+        record_change(db.session, Question, 'delete_many', {'ids': frozenset(ids)})
+
+    db.session.commit()
+    return len(ids)
@@ -0,0 +1,54 @@
+import time
+
+from models import db, Category, DataRevision
+from .compression import CompressedBody
+from .etag import revision_cache
+from .json_provider import dumps_bytes
+from .model_events import on_commit
+
+CATEGORY_CACHE_TTL = 60
+
+
+class CategoryCache:
+    """
+    CategoryCache
+        keeps the {id: type} category map and the serialized /categories
+        body in memory, the body along with its compressed variants. Writes in this process invalidate it on commit;
+        the TTL bounds how long other workers keep serving an old map.
+        Each entry remembers the data revision it was loaded at and is
+        reloaded once the revision the ETags are built from has moved past
+        it, so a tag is never paired with a map older than it describes.
+    """
+
+    def __init__(self, ttl=CATEGORY_CACHE_TTL):
+        self.ttl = ttl
+        self._entry = None
+
+    def invalidate(self, *args):
+        self._entry = None
+
+    def _load(self):
+        entry = self._entry
+        if (entry is None or time.monotonic() - entry[0] > self.ttl
+                or entry[1] < revision_cache.current()):
+            with db.session().primary():
+                revision = DataRevision.current()
+                categories = Category.query.order_by(Category.type).all()
+            categories = {category.id: category.type for category in categories}
+            body = CompressedBody(dumps_bytes({
+                'success': True,
+                'categories': categories
+            }))
+            entry = (time.monotonic(), revision, categories, body)
+            self._entry = entry
+        return entry
+
+    def categories(self):
+        return self._load()[2]
+
+    def body(self):
+        return self._load()[3]
+
+
+category_cache = CategoryCache()
+on_commit(Category, category_cache.invalidate)
@@ -0,0 +1,146 @@
+import gzip
+import zlib
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = 500
+COMPRESS_LEVEL = 6
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/x-ndjson',
+    'text/csv',
+    'text/plain',
+}
+
+
+def available_encodings():
+    # In order of preference, brotli only when the module is installed.
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compress(data, encoding, level=COMPRESS_LEVEL):
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def compress_stream(chunks, encoding, level=COMPRESS_LEVEL):
+    """
+    compress_stream(chunks, encoding, level)
+        compresses an iterable of text or byte chunks into a single encoded
+        stream. Every chunk is flushed, so clients receive data as it is
+        produced instead of when the stream ends.
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=level)
+        process, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        process, finish = compressor.compress, compressor.flush
+        flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        data = process(chunk) + flush()
+        if data:
+            yield data
+    yield finish()
+
+
+def variant_etag(etag, encoding):
+    # Each encoding of a body is a different representation with its own tag.
+    return f'{etag}-{encoding}' if encoding else etag
+
+
+class CompressedBody:
+    """
+    CompressedBody
+        a serialized response body that keeps its encoded variants, so a
+        cached body is compressed once per encoding instead of per request.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self._variants = {}
+
+    def __len__(self):
+        return len(self.data)
+
+    def encoded(self, encoding, level=COMPRESS_LEVEL):
+        if encoding is None:
+            return self.data
+        variant = self._variants.get(encoding)
+        if variant is None:
+            variant = self._variants[encoding] = compress(self.data, encoding, level)
+        return variant
+
+
+class Compression:
+    """
+    Compression
+        negotiates gzip or brotli with the client and compresses JSON and
+        text responses of at least min_size bytes after the view returns.
+        Cached bodies and streamed exports are compressed by their views,
+        responses that already carry a Content-Encoding are left alone.
+    """
+
+    def __init__(self, min_size=COMPRESS_MIN_SIZE, level=COMPRESS_LEVEL):
+        self.min_size = min_size
+        self.level = level
+
+    def init_app(self, app):
+        self.min_size = app.config['COMPRESS_MIN_SIZE']
+        self.level = app.config['COMPRESS_LEVEL']
+        app.after_request(self.compress_response)
+
+    def negotiate(self):
+        return request.accept_encodings.best_match(available_encodings())
+
+    def respond(self, body, mimetype):
+        """
+        returns a response for a CompressedBody, in the negotiated encoding
+        when the body is large enough to be worth compressing.
+        """
+        encoding = self.negotiate() if len(body) >= self.min_size else None
+        response = current_app.response_class(body.encoded(encoding, self.level), mimetype=mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+    def stream(self, chunks):
+        """
+        returns chunks, compressed in the negotiated encoding if any, and
+        the headers to send with them.
+        """
+        encoding = self.negotiate()
+        if encoding is None:
+            return chunks, {}
+        return compress_stream(chunks, encoding, self.level), {'Content-Encoding': encoding}
+
+    def compress_response(self, response):
+        if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return response
+        response.vary.add('Accept-Encoding')
+
+        encoding = response.headers.get('Content-Encoding')
+        if encoding is None and not response.is_streamed and not response.direct_passthrough:
+            data = response.get_data()
+            if len(data) >= self.min_size:
+                encoding = self.negotiate()
+                if encoding:
+                    response.set_data(compress(data, encoding, self.level))
+                    response.headers['Content-Encoding'] = encoding
+
+        etag, weak = response.get_etag()
+        if etag and encoding:
+            response.set_etag(variant_etag(etag, encoding), weak)
+        return response
+
+
+compression = Compression()
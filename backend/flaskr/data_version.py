@@ -0,0 +1,26 @@
+import threading
+
+from models import Question, Category
+from .model_events import on_commit
+
+
+class DataVersion:
+    """
+    DataVersion
+        a counter bumped after every commit that writes a question or a
+        category in this worker. Anything derived from those tables can
+        remember the version it was built at and detect that it is stale.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def bump(self, *args):
+        with self._lock:
+            self.value += 1
+
+
+data_version = DataVersion()
+on_commit(Question, data_version.bump)
+on_commit(Category, data_version.bump)
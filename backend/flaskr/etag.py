@@ -0,0 +1,93 @@
+import functools
+import threading
+import time
+from flask import current_app, request, make_response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, DataRevision
+from .compression import compression, variant_etag
+from .data_version import data_version
+from .model_events import pending_changes
+
+ETAG_REVISION_TTL = 5
+
+
+@event.listens_for(Session, 'before_commit')
+def _bump_revision(session):
+    # Count the commit in the shared revision, in the same transaction as
+    # the rows it changes, when it writes questions or categories. Only
+    # the outermost commit counts, not every savepoint released before it.
+    if session.in_nested_transaction():
+        return
+    session.flush()
+    if pending_changes(session) and not session.info.get('revision_bumped'):
+        DataRevision.bump(session)
+        session.info['revision_bumped'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _reset_revision(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop('revision_bumped', None)
+
+
+class RevisionCache:
+    """
+    RevisionCache
+        the shared data revision as last read by this worker. It is read
+        again after a write through this worker and at most every ttl
+        seconds otherwise, so checking an ETag rarely touches the database.
+        Each database is tracked apart, so data read from a lagging replica
+        is tagged with the revision of that replica, not of the primary.
+    """
+
+    def __init__(self, ttl=ETAG_REVISION_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def invalidate(self):
+        self._entries = {}
+
+    def current(self):
+        replica = db.session().replica
+        entry = self._entries.get(replica)
+        if entry is None or entry[1] != data_version.value or time.monotonic() - entry[0] > self.ttl:
+            with self._lock:
+                version = data_version.value
+                entry = (time.monotonic(), version, DataRevision.current())
+                self._entries[replica] = entry
+        return entry[2]
+
+
+revision_cache = RevisionCache()
+
+
+def conditional(view):
+    """
+    conditional(view)
+        tags the successful responses of a GET view with an ETag derived
+        from the data revision and answers a matching If-None-Match with
+        304 Not Modified without calling the view.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        etag = f'r{revision_cache.current()}'
+
+        # Small bodies are sent uncompressed, so accept either tag.
+        for candidate in (variant_etag(etag, compression.negotiate()), etag):
+            # If-None-Match compares weakly, proxies weaken the tags they recompress.
+            if request.if_none_match.contains_weak(candidate):
+                response = current_app.response_class(status=304)
+                response.set_etag(candidate)
+                response.vary.add('Accept-Encoding')
+                return response
+
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200:
+            response.set_etag(etag)
+        return response
+    return wrapper
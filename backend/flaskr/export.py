@@ -0,0 +1,43 @@
+import csv
+import io
+from flask import json
+
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_COLUMNS = ('id', 'question', 'answer', 'category', 'difficulty')
+
+EXPORT_MIMETYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def ndjson_line(question):
+    return json.dumps(question) + '\n'
+
+
+def csv_line(question):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow([question[column] for column in EXPORT_COLUMNS])
+    return buffer.getvalue()
+
+
+def export_lines(questions, export_format, batch_size=EXPORT_BATCH_SIZE):
+    """
+    export_lines(questions, export_format, batch_size)
+        yields questions, dicts shaped like Question.format(), as text chunks of batch_size lines,
+        so an export never holds more than one batch in memory.
+    """
+    format_line = ndjson_line if export_format == 'ndjson' else csv_line
+    chunk = []
+    if export_format == 'csv':
+        chunk.append(','.join(EXPORT_COLUMNS) + '\r\n')
+
+    for question in questions:
+        chunk.append(format_line(question))
+        if len(chunk) >= batch_size:
+            yield ''.join(chunk)
+            chunk = []
+
+    if chunk:
+        yield ''.join(chunk)
@@ -0,0 +1,123 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from models import db
+
+GROUP_COMMIT_MAX_DELAY = 0.005
+GROUP_COMMIT_MAX_BATCH = 100
+GROUP_COMMIT_TIMEOUT = 10
+
+
+class GroupCommitTimeout(Exception):
+    """The group commit thread did not answer within the timeout."""
+
+
+class GroupCommitQueue:
+    """
+    GroupCommitQueue
+        an opt-in write path that commits the inserts of concurrent requests
+        together. A background thread collects the queued instances for at
+        most max_delay seconds, stages each one in its own savepoint so a
+        failing row only fails its own request, and commits the batch in a
+        single transaction. Callers block until their row is committed, at
+        most timeout seconds.
+    """
+
+    def __init__(self, max_delay=GROUP_COMMIT_MAX_DELAY, max_batch=GROUP_COMMIT_MAX_BATCH,
+                 timeout=GROUP_COMMIT_TIMEOUT):
+        self.app = None
+        self.enabled = False
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config['GROUP_COMMIT']
+        self.max_delay = app.config['GROUP_COMMIT_MAX_DELAY']
+        self.max_batch = app.config['GROUP_COMMIT_MAX_BATCH']
+        self.timeout = app.config['GROUP_COMMIT_TIMEOUT']
+
+    def insert(self, instance):
+        """
+        inserts instance, which needs a stage() method, and returns once it
+        is committed. Raises the error that made its insert fail, or
+        GroupCommitTimeout when no answer came within the timeout.
+        """
+        if not self.enabled:
+            instance.insert()
+            return
+
+        self._start()
+        future = Future()
+        self._queue.put((instance, future))
+        try:
+            future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # A cancelled instance is never staged. Once its batch started,
+            # the outcome is unknown and the caller has to check.
+            future.cancel()
+            raise GroupCommitTimeout()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                batch = [self._queue.get()]
+                deadline = time.monotonic() + self.max_delay
+                while len(batch) < self.max_batch:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(self._queue.get(timeout=timeout))
+                    except queue.Empty:
+                        break
+                try:
+                    self._commit(batch)
+                except Exception as error:
+                    # Whatever broke, no request may wait for this batch
+                    # forever, and the next batch starts from a new session.
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(error)
+                    db.session.remove()
+
+    def _commit(self, batch):
+        staged = []
+        for instance, future in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                with db.session.begin_nested():
+                    instance.stage()
+                # Detach the flushed row so the commit does not expire what
+                # the request thread is about to read.
+                db.session.expunge(instance)
+                staged.append(future)
+            except Exception as error:
+                future.set_exception(error)
+
+        try:
+            db.session.commit()
+        except Exception as error:
+            db.session.rollback()
+            for future in staged:
+                future.set_exception(error)
+            return
+
+        for future in staged:
+            future.set_result(None)
+
+
+write_queue = GroupCommitQueue()
@@ -0,0 +1,81 @@
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_BACKEND = 'auto'
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    OrjsonProvider
+        serializes with orjson, several times faster than the stdlib encoder
+        on large question lists. Output is compact UTF-8 with sorted keys,
+        values orjson cannot encode go through DefaultJSONProvider.default,
+        and anything it still rejects, such as integers wider than 64 bits,
+        falls back to the stdlib encoder.
+        It decodes to the same values as the stdlib output, not to the same
+        bytes: non-ASCII text is not escaped and integer keys sort as strings.
+    """
+
+    def _options(self):
+        options = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def dumps_bytes(self, obj):
+        try:
+            return orjson.dumps(obj, default=self.default, option=self._options())
+        except TypeError:
+            return super().dumps(obj).encode('utf-8')
+
+    def dumps(self, obj, **kwargs):
+        # Formatting options such as indent are only known to the stdlib.
+        if set(kwargs) - {'separators'}:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
+
+
+json_providers = {
+    'stdlib': DefaultJSONProvider,
+}
+if orjson is not None:
+    json_providers['orjson'] = OrjsonProvider
+
+
+def json_provider(backend):
+    """
+    json_provider(backend)
+        returns the provider class registered as backend, 'auto' picks the
+        fastest one installed.
+    """
+    if backend == 'auto':
+        return json_providers.get('orjson', DefaultJSONProvider)
+    return json_providers[backend]
+
+
+def dumps_bytes(obj):
+    """
+    dumps_bytes(obj)
+        serializes obj to UTF-8 JSON with the provider of the current app,
+        without a round trip through str when the provider can avoid it.
+    """
+    provider = current_app.json
+    if isinstance(provider, OrjsonProvider):
+        return provider.dumps_bytes(obj)
+    return provider.dumps(obj).encode('utf-8')
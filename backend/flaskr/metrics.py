@@ -0,0 +1,33 @@
+import re
+
+collectors = []
+
+
+def collector(function):
+    """
+    collector(function)
+        registers a function returning (name, type, value) samples to be
+        exposed on /metrics. name may carry labels, and histogram samples
+        use the _bucket, _sum and _count suffixes.
+    """
+    collectors.append(function)
+    return function
+
+
+def render():
+    """
+    render()
+        returns the samples of every collector in the Prometheus text format.
+    """
+    lines = []
+    families = set()
+    for function in collectors:
+        for name, kind, value in function():
+            family = name.split('{')[0]
+            if kind == 'histogram':
+                family = re.sub(r'_(bucket|sum|count)$', '', family)
+            if family not in families:
+                families.add(family)
+                lines.append(f'# TYPE {family} {kind}')
+            lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,98 @@
+import logging
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+_callbacks = {}
+
+
+def on_commit(model, callback):
+    """
+    on_commit(model, callback)
+        calls callback(action, values, previous) once a transaction that
+        inserted, updated or deleted a row of model has been committed.
+        action is 'insert', 'update' or 'delete', values holds the column
+        values of the row as they were flushed and, for updates, previous
+        holds the old values of the columns that changed.
+        Bulk deletes report all their rows at once as 'delete_many', with
+        values holding only {'ids': frozenset of the deleted ids}.
+    """
+    if model not in _callbacks:
+        _callbacks[model] = []
+        for action in ('insert', 'update', 'delete'):
+            event.listen(model, f'after_{action}', _recorder(action))
+    _callbacks[model].append(callback)
+
+
+def _recorder(action):
+    def record(mapper, connection, target):
+        values = {column.key: getattr(target, column.key) for column in mapper.column_attrs}
+        previous = {}
+        if action == 'update':
+            state = inspect(target)
+            for column in mapper.column_attrs:
+                history = state.attrs[column.key].history
+                if history.deleted:
+                    previous[column.key] = history.deleted[0]
+        record_change(Session.object_session(target), mapper.class_, action, values, previous)
+    return record
+
+
+def record_change(session, model, action, values, previous=None):
+    """
+    record_change(session, model, action, values, previous)
+        queues the on_commit callbacks of model for a row written by session
+        without going through the ORM, such as a bulk insert or delete.
+    """
+    session.info.setdefault('committed_changes', []).append(
+        (model, action, values, previous or {}))
+
+
+def pending_changes(session):
+    """
+    pending_changes(session)
+        returns the (model, action, values, previous) changes recorded in
+        the current transaction of session so far.
+    """
+    return session.info.get('committed_changes', [])
+
+
+@event.listens_for(Session, 'after_transaction_create')
+def _mark_savepoint(session, transaction):
+    if transaction.nested:
+        session.info.setdefault('savepoint_marks', {})[transaction] = len(pending_changes(session))
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _forget_savepoint(session, transaction):
+    if transaction.nested:
+        session.info.get('savepoint_marks', {}).pop(transaction, None)
+
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch(session):
+    # Releasing a savepoint fires after_commit too, but nothing is
+    # committed until the outermost transaction is.
+    if session.in_nested_transaction():
+        return
+    changes = session.info.pop('committed_changes', [])
+    for model, action, values, previous in changes:
+        for callback in _callbacks.get(model, []):
+            # The rows are committed already, a failing callback must not
+            # fail the request or keep the other callbacks from running.
+            try:
+                callback(action, values, previous)
+            except Exception:
+                logger.exception('on_commit callback %r failed for %s %s', callback, action, model.__name__)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard(session):
+    if session.in_nested_transaction():
+        # Rolling back a savepoint only undoes the changes recorded since it began.
+        mark = session.info.get('savepoint_marks', {}).get(session.get_nested_transaction())
+        if mark is not None:
+            del pending_changes(session)[mark:]
+        return
+    session.info.pop('committed_changes', None)
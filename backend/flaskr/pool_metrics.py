@@ -0,0 +1,28 @@
+from models import db
+from db_pool import TimedQueuePool
+from .metrics import collector
+
+
+@collector
+def pool_metrics():
+    # One set of samples per engine, the primary and each read replica.
+    samples = []
+    for key, engine in db.engines.items():
+        pool = engine.pool
+        if not isinstance(pool, TimedQueuePool):
+            continue
+
+        label = f'database="{key or "primary"}"'
+        samples += [
+            (f'trivia_db_pool_size{{{label}}}', 'gauge', pool.size()),
+            (f'trivia_db_pool_checked_out{{{label}}}', 'gauge', pool.checkedout()),
+            (f'trivia_db_pool_checked_in{{{label}}}', 'gauge', pool.checkedin()),
+            (f'trivia_db_pool_overflow{{{label}}}', 'gauge', pool.overflow()),
+        ]
+        wait_times = pool.wait_times
+        for bound, count in zip(wait_times.buckets, wait_times.counts):
+            samples.append((f'trivia_db_pool_wait_seconds_bucket{{{label},le="{bound}"}}', 'histogram', count))
+        samples.append((f'trivia_db_pool_wait_seconds_bucket{{{label},le="+Inf"}}', 'histogram', wait_times.count))
+        samples.append((f'trivia_db_pool_wait_seconds_sum{{{label}}}', 'histogram', wait_times.sum))
+        samples.append((f'trivia_db_pool_wait_seconds_count{{{label}}}', 'histogram', wait_times.count))
+    return samples
@@ -0,0 +1,147 @@
+import random
+import threading
+import time
+from array import array
+
+from models import db, Question, QuestionCount
+from .model_events import on_commit
+
+QUIZ_INDEX_TTL = 300
+
+# Number of random draws tried before falling back to filtering the ids.
+MAX_DRAWS = 32
+
+
+class QuizSelector:
+    """
+    QuizSelector
+        picks random quiz questions from an in-memory index of question ids
+        per category, so a quiz turn never loads the candidate rows.
+        Commits in this worker keep the index current; the TTL bounds how
+        long questions added by other workers are missing from it. Once it
+        expires, one request reloads it while the others keep drawing from
+        the old index.
+    """
+
+    def __init__(self, ttl=QUIZ_INDEX_TTL):
+        self.ttl = ttl
+        self._build_lock = threading.Lock()
+        self._entry = None
+
+    def invalidate(self):
+        self._entry = None
+
+    @staticmethod
+    def bucket(category):
+        # Questions without a category get a list of their own, apart from
+        # the list of all questions under 0.
+        return int(category) if category not in (None, '') else None
+
+    def build(self):
+        index = {0: array('i')}
+        with db.session().primary():
+            rows = db.session.query(Question.id, Question.category).yield_per(10000)
+            for question_id, category in rows:
+                index.setdefault(self.bucket(category), array('i')).append(question_id)
+                index[0].append(question_id)
+        entry = (time.monotonic(), index)
+        self._entry = entry
+        return entry
+
+    def _load(self):
+        entry = self._entry
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            # Only wait for the reload when there is no index to serve yet.
+            if self._build_lock.acquire(blocking=entry is None):
+                try:
+                    current = self._entry
+                    if current is None or current is entry:
+                        current = self.build()
+                    entry = current
+                finally:
+                    self._build_lock.release()
+        return entry[1]
+
+    def ids(self, category=0):
+        return self._load().get(QuestionCount.key(category), array('i'))
+
+    def discard(self, question_id):
+        # Called from after_commit hooks, where the session cannot run the
+        # queries of a reload, so only an index that is already loaded changes.
+        entry = self._entry
+        if entry is None:
+            return
+        for ids in entry[1].values():
+            try:
+                ids.remove(question_id)
+            except ValueError:
+                pass
+
+    def discard_many(self, question_ids):
+        entry = self._entry
+        if entry is None:
+            return
+        index = entry[1]
+        for category, ids in index.items():
+            index[category] = array('i', (question_id for question_id in ids if question_id not in question_ids))
+
+    def _question_changed(self, action, values, previous):
+        if self._entry is None:
+            return
+        if action == 'delete_many':
+            self.discard_many(values['ids'])
+            return
+        index = self._entry[1]
+        question_id = values['id']
+
+        if action == 'delete':
+            self.discard(question_id)
+            return
+        if action == 'update':
+            if 'category' not in previous:
+                return
+            ids = index.get(self.bucket(previous['category']))
+            if ids is not None and question_id in ids:
+                ids.remove(question_id)
+        else:
+            index[0].append(question_id)
+        index.setdefault(self.bucket(values['category']), array('i')).append(question_id)
+
+    def choose(self, category=0, exclude=()):
+        """
+        returns the id of a random question of category (0 for all
+        categories) that is not in exclude, or None when none is left.
+        exclude is any container supporting `in` and len().
+        """
+        ids = self.ids(category)
+
+        if len(exclude) < len(ids) // 2:
+            for _ in range(MAX_DRAWS):
+                question_id = ids[random.randrange(len(ids))]
+                if question_id not in exclude:
+                    return question_id
+
+        remaining = [question_id for question_id in ids if question_id not in exclude]
+        if not remaining:
+            return None
+        return random.choice(remaining)
+
+    def next_question(self, category=0, exclude=()):
+        """
+        returns a random Question of category not in exclude, or None.
+        Ids whose row has been deleted by another worker are dropped and
+        added to exclude, so exclude also needs an add() method.
+        """
+        while True:
+            question_id = self.choose(category, exclude)
+            if question_id is None:
+                return None
+            question = Question.query.get(question_id)
+            if question is not None:
+                return question
+            self.discard(question_id)
+            exclude.add(question_id)
+
+
+quiz_selector = QuizSelector()
+on_commit(Question, quiz_selector._question_changed)
@@ -0,0 +1,59 @@
+import functools
+from datetime import timedelta
+from flask import current_app, request
+
+from models import db
+
+REPLICA_STICKINESS = 5
+STICKY_COOKIE = 'trivia_primary'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def reads_from_replica(view):
+    """
+    reads_from_replica(view)
+        marks a view as read only and runs its queries on a read replica,
+        unless the client wrote recently and still carries the sticky
+        cookie, in which case it reads its own writes from the primary.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        # db.session is a scoped proxy, the routing lives on the session itself.
+        session = db.session()
+        if STICKY_COOKIE not in request.cookies:
+            session.use_replica()
+        try:
+            return view(*args, **kwargs)
+        finally:
+            session.use_primary()
+    wrapper.read_only = True
+    return wrapper
+
+
+class ReplicaStickiness:
+    """
+    ReplicaStickiness
+        after a successful write request, sets a cookie that keeps the
+        client on the primary for stickiness seconds, long enough for the
+        replicas to catch up with what it just wrote.
+    """
+
+    def __init__(self, stickiness=REPLICA_STICKINESS):
+        self.stickiness = stickiness
+
+    def init_app(self, app):
+        self.stickiness = app.config['REPLICA_STICKINESS']
+        if app.config['SQLALCHEMY_BINDS']:
+            app.after_request(self.stick_to_primary)
+
+    def stick_to_primary(self, response):
+        view = current_app.view_functions.get(request.endpoint)
+        if (request.method not in SAFE_METHODS and not getattr(view, 'read_only', False)
+                and response.status_code < 400 and self.stickiness > 0):
+            response.set_cookie(STICKY_COOKIE, '1', max_age=timedelta(seconds=self.stickiness),
+                                httponly=True, samesite='Lax')
+        return response
+
+
+replica_stickiness = ReplicaStickiness()
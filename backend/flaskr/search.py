@@ -0,0 +1,103 @@
+import heapq
+from flask import current_app
+from sqlalchemy import func, literal, literal_column, or_, select
+
+from models import db, Question, FORMATTED_QUESTION, QUESTION_SEARCH_DOCUMENT
+from .search_index import search_index
+
+SEARCH_BACKEND = 'ilike'
+SEARCH_TRIGRAM_THRESHOLD = 0.3
+SEARCH_MAX_PAGE_SIZE = 100
+SEARCH_COUNT_LIMIT = 10000
+
+search_backends = {}
+
+
+def search_backend(name):
+    """
+    search_backend(name)
+        registers a function(term, offset, limit, count_limit) returning the
+        number of matches, which may stop at count_limit + 1, and the
+        matching questions from offset, at most limit of them, formatted as
+        dicts like Question.format(), as the search backend called name.
+    """
+    def register(backend):
+        search_backends[name] = backend
+        return backend
+    return register
+
+
+def query_search_backend(name):
+    """
+    query_search_backend(name)
+        registers a function returning a query of the questions matching a
+        term, in result order, as the search backend called name.
+    """
+    def register(backend):
+        def search(term, offset, limit, count_limit):
+            selection = backend(term)
+            # Stop counting after count_limit + 1 rows, broad terms match most of the table.
+            counted = selection.order_by(None).with_entities(Question.id).limit(count_limit + 1).subquery()
+            total = db.session.query(func.count()).select_from(counted).scalar()
+            return total, selection.with_entities(FORMATTED_QUESTION).offset(offset).limit(limit).all()
+        search_backends[name] = search
+        return backend
+    return register
+
+
+@query_search_backend('ilike')
+def ilike_search(term):
+    return Question.query.filter(
+        Question.question.ilike(f'%{term}%')).order_by(Question.id)
+
+
+@query_search_backend('fulltext')
+def fulltext_search(term):
+    # Postgres full text search over question and answer, served by the
+    # ix_questions_search GIN index and ranked by relevance.
+    document = literal_column(QUESTION_SEARCH_DOCUMENT)
+    query = func.plainto_tsquery('english', term)
+    return Question.query.filter(document.op('@@')(query)).order_by(
+        func.ts_rank_cd(document, query).desc(), Question.id)
+
+
+@query_search_backend('trigram')
+def trigram_search(term):
+    # pg_trgm search served by the ix_questions_question_trgm GIN index:
+    # substring matches plus words similar to the term, best match first.
+    if len(term) < 3:
+        # Too short for trigrams, stop at the first page of id ordered rows.
+        return ilike_search(term)
+
+    threshold = current_app.config['SEARCH_TRIGRAM_THRESHOLD']
+    db.session.execute(select(func.set_config(
+        'pg_trgm.word_similarity_threshold', str(threshold), True)))
+
+    return Question.query.filter(or_(
+        Question.question.ilike(f'%{term}%'),
+        literal(term).op('<%')(Question.question))).order_by(
+        func.word_similarity(term, Question.question).desc(), Question.id)
+
+
+@search_backend('memory')
+def memory_search(term, offset, limit, count_limit):
+    # In-process BM25 index, see search_index.py. Built by the first search.
+    search_index.ensure_built()
+
+    scores = search_index.search(term)
+    ranked = heapq.nsmallest(
+        offset + limit, scores, key=lambda question_id: (-scores[question_id], question_id))[offset:]
+
+    questions = {question['id']: question for question in
+                 db.session.query(FORMATTED_QUESTION).filter(Question.id.in_(ranked))} if ranked else {}
+    return len(scores), [questions[question_id] for question_id in ranked if question_id in questions]
+
+
+def search_questions(term, backend, offset, limit, count_limit):
+    """
+    search_questions(term, backend, offset, limit, count_limit)
+        returns the number of questions matching term, or count_limit + 1
+        when there are more than count_limit of them, and the matching
+        questions from offset, at most limit of them, as dicts.
+    """
+    return search_backends[backend](term, offset, limit, count_limit)
@@ -0,0 +1,74 @@
+import threading
+import time
+from collections import OrderedDict
+
+from .data_version import data_version
+from .metrics import collector
+
+SEARCH_CACHE_SIZE = 1024
+SEARCH_CACHE_TTL = 30
+
+
+def normalize(term):
+    # Every search backend ignores case, nothing else can be folded safely.
+    return term.lower()
+
+
+class SearchCache:
+    """
+    SearchCache
+        a bounded LRU cache of serialized /questions/search responses,
+        kept as CompressedBody so hot pages are compressed only once.
+        Entries remember the data version they were built at, so any
+        question write in this worker invalidates them; the TTL bounds how
+        long writes made by other workers go unnoticed.
+    """
+
+    def __init__(self, size=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, version, body = entry
+                if version == data_version.value and time.monotonic() < expires:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return body
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, body, version):
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, version, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+search_cache = SearchCache()
+
+
+@collector
+def search_cache_metrics():
+    return [
+        ('trivia_search_cache_hits_total', 'counter', search_cache.hits),
+        ('trivia_search_cache_misses_total', 'counter', search_cache.misses),
+        ('trivia_search_cache_evictions_total', 'counter', search_cache.evictions),
+        ('trivia_search_cache_entries', 'gauge', len(search_cache._entries)),
+    ]
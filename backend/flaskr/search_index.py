@@ -0,0 +1,181 @@
+import math
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+
+from models import db, Question
+from .model_events import on_commit
+
+TOKEN = re.compile(r'\w+')
+
+SEARCH_INDEX_TTL = 300
+
+# A query token matches every indexed term it is a prefix of, up to this many.
+MAX_PREFIX_TERMS = 64
+
+
+def tokenize(text):
+    return TOKEN.findall(text.lower()) if text else []
+
+
+def question_tokens(values):
+    return tokenize(values.get('question')) + tokenize(values.get('answer'))
+
+
+class InvertedIndex:
+    """
+    InvertedIndex
+        a pure Python BM25 search index over question and answer text, for
+        deployments that cannot rely on Postgres search extensions.
+        Every term maps to two parallel arrays, the question ids and the
+        number of times the term appears in each of them, and document
+        lengths live in an array indexed by question id, so the index
+        costs a few bytes per posting.
+        Commits in this worker keep it current; it is rebuilt every ttl
+        seconds to pick up questions written by other processes.
+    """
+
+    def __init__(self, k1=1.2, b=0.75, ttl=SEARCH_INDEX_TTL):
+        self.k1 = k1
+        self.b = b
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self.built = False
+        self.built_at = 0
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.postings = {}
+            self.terms = []
+            self.lengths = array('H')
+            self.documents = 0
+            self.total_length = 0
+
+    def build(self):
+        # Build a fresh index and swap it in, so searches keep using the
+        # current one while a rebuild runs.
+        fresh = InvertedIndex(self.k1, self.b)
+        with db.session().primary():
+            rows = db.session.query(Question.id, Question.question, Question.answer).yield_per(10000)
+            for question_id, question, answer in rows:
+                fresh.add({'id': question_id, 'question': question, 'answer': answer})
+
+        with self._lock:
+            self.postings = fresh.postings
+            self.terms = fresh.terms
+            self.lengths = fresh.lengths
+            self.documents = fresh.documents
+            self.total_length = fresh.total_length
+            self.built = True
+            self.built_at = time.monotonic()
+
+    def expired(self):
+        return not self.built or time.monotonic() - self.built_at > self.ttl
+
+    def invalidate(self):
+        with self._lock:
+            self.clear()
+            self.built = False
+
+    def ensure_built(self):
+        if self.expired():
+            with self._build_lock:
+                if self.expired():
+                    self.build()
+
+    def add(self, values):
+        tokens = question_tokens(values)
+        question_id = values['id']
+        frequencies = {}
+        for token in tokens:
+            frequencies[token] = frequencies.get(token, 0) + 1
+
+        with self._lock:
+            if question_id < len(self.lengths) and self.lengths[question_id]:
+                return
+            for token, frequency in frequencies.items():
+                posting = self.postings.get(token)
+                if posting is None:
+                    posting = self.postings[token] = (array('i'), array('H'))
+                    insort(self.terms, token)
+                posting[0].append(question_id)
+                posting[1].append(min(frequency, 0xffff))
+
+            if question_id >= len(self.lengths):
+                missing = question_id + 1 - len(self.lengths)
+                self.lengths.frombytes(bytes(missing * self.lengths.itemsize))
+            self.lengths[question_id] = min(max(len(tokens), 1), 0xffff)
+            self.documents += 1
+            self.total_length += self.lengths[question_id]
+
+    def remove(self, values):
+        question_id = values['id']
+        with self._lock:
+            if question_id >= len(self.lengths) or not self.lengths[question_id]:
+                return
+            for token in set(question_tokens(values)):
+                posting = self.postings.get(token)
+                if posting is None:
+                    continue
+                try:
+                    position = posting[0].index(question_id)
+                except ValueError:
+                    continue
+                del posting[0][position]
+                del posting[1][position]
+                if not posting[0]:
+                    del self.postings[token]
+                    del self.terms[bisect_left(self.terms, token)]
+
+            self.documents -= 1
+            self.total_length -= self.lengths[question_id]
+            self.lengths[question_id] = 0
+
+    def expand(self, token):
+        start = bisect_left(self.terms, token)
+        end = start
+        while (end < len(self.terms) and end - start < MAX_PREFIX_TERMS
+               and self.terms[end].startswith(token)):
+            end += 1
+        return self.terms[start:end]
+
+    def search(self, text):
+        """
+        returns a dict of question id to BM25 score for the questions
+        containing a term that starts with one of the tokens of text.
+        """
+        scores = {}
+        with self._lock:
+            if not self.documents:
+                return scores
+            average_length = self.total_length / self.documents
+            for token in set(tokenize(text)):
+                for term in self.expand(token):
+                    ids, frequencies = self.postings[term]
+                    idf = math.log(1 + (self.documents - len(ids) + 0.5) / (len(ids) + 0.5))
+                    for question_id, frequency in zip(ids, frequencies):
+                        norm = self.k1 * (1 - self.b + self.b * self.lengths[question_id] / average_length)
+                        score = idf * frequency * (self.k1 + 1) / (frequency + norm)
+                        scores[question_id] = scores.get(question_id, 0) + score
+        return scores
+
+    def _question_changed(self, action, values, previous):
+        if not self.built:
+            return
+        if action == 'delete_many':
+            # Postings are found through the tokens of a question, which a
+            # bulk delete does not return, so the next search rebuilds.
+            self.invalidate()
+            return
+        if action in ('update', 'delete'):
+            self.remove(dict(values, **previous))
+        if action in ('insert', 'update'):
+            self.add(values)
+
+
+search_index = InvertedIndex()
+on_commit(Question, search_index._question_changed)
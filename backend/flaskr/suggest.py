@@ -0,0 +1,99 @@
+import threading
+import time
+from bisect import bisect_left, insort
+
+from models import db, Question
+from .model_events import on_commit
+
+SUGGEST_INDEX_TTL = 300
+
+# Only this many leading characters of a question are indexed.
+MAX_KEY_LENGTH = 64
+
+
+def normalize(text):
+    return ' '.join(text.lower().split())[:MAX_KEY_LENGTH] if text else ''
+
+
+class SuggestionIndex:
+    """
+    SuggestionIndex
+        a sorted list of normalized question stems, each followed by its
+        question id, so the questions starting with a prefix are found with
+        one bisect instead of a table scan. Commits in this worker keep it
+        current; the TTL bounds how long other workers' writes are missing.
+        Once it expires, one request reloads it while the others keep
+        searching the old list.
+    """
+
+    def __init__(self, ttl=SUGGEST_INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._entry = None
+
+    def invalidate(self):
+        self._entry = None
+
+    @staticmethod
+    def key(values):
+        return f"{normalize(values['question'])}\x00{values['id']}"
+
+    def build(self):
+        with db.session().primary():
+            rows = db.session.query(Question.id, Question.question).yield_per(10000)
+            keys = sorted(self.key({'id': question_id, 'question': question})
+                          for question_id, question in rows)
+        entry = (time.monotonic(), keys)
+        self._entry = entry
+        return entry
+
+    def _load(self):
+        entry = self._entry
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            # Only wait for the reload when there is no list to search yet.
+            if self._build_lock.acquire(blocking=entry is None):
+                try:
+                    current = self._entry
+                    if current is None or current is entry:
+                        current = self.build()
+                    entry = current
+                finally:
+                    self._build_lock.release()
+        return entry[1]
+
+    def suggest(self, prefix, limit):
+        """
+        returns the ids of at most limit questions starting with prefix,
+        in alphabetical order.
+        """
+        prefix = normalize(prefix)
+        keys = self._load()
+        with self._lock:
+            position = bisect_left(keys, prefix)
+            ids = []
+            while position < len(keys) and len(ids) < limit and keys[position].startswith(prefix):
+                ids.append(int(keys[position].rsplit('\x00', 1)[1]))
+                position += 1
+        return ids
+
+    def _question_changed(self, action, values, previous):
+        if self._entry is None:
+            return
+        keys = self._entry[1]
+        with self._lock:
+            if action == 'delete_many':
+                ids = values['ids']
+                keys[:] = [key for key in keys if int(key.rsplit('\x00', 1)[1]) not in ids]
+                return
+            if action in ('update', 'delete'):
+                key = self.key(dict(values, **previous))
+                position = bisect_left(keys, key)
+                if position < len(keys) and keys[position] == key:
+                    del keys[position]
+            if action in ('insert', 'update'):
+                insort(keys, self.key(values))
+
+
+suggestion_index = SuggestionIndex()
+on_commit(Question, suggestion_index._question_changed)
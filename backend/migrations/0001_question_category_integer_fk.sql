@@ -0,0 +1,27 @@
+--
+-- Turns questions.category into an indexed integer foreign key to
+-- categories.id. Safe to run on databases created from trivia.psql and on
+-- databases where create_all() made category a character column.
+--
+-- Usage: psql trivia < migrations/0001_question_category_integer_fk.sql
+--
+
+BEGIN;
+
+ALTER TABLE public.questions DROP CONSTRAINT IF EXISTS category;
+
+-- Backfill: blank or non numeric values cannot reference a category.
+ALTER TABLE public.questions
+    ALTER COLUMN category TYPE integer
+    USING CASE WHEN trim(category::text) ~ '^[0-9]+$' THEN trim(category::text)::integer END;
+
+UPDATE public.questions SET category = NULL
+    WHERE category IS NOT NULL
+    AND category NOT IN (SELECT id FROM public.categories);
+
+ALTER TABLE ONLY public.questions
+    ADD CONSTRAINT category FOREIGN KEY (category) REFERENCES public.categories(id) ON UPDATE CASCADE ON DELETE SET NULL;
+
+CREATE INDEX IF NOT EXISTS ix_questions_category ON public.questions USING btree (category);
+
+COMMIT;
@@ -0,0 +1,10 @@
+--
+-- Adds the GIN index used by the full text search backend
+-- (SEARCH_BACKEND=fulltext). The expression must match
+-- models.QUESTION_SEARCH_DOCUMENT exactly.
+--
+-- Usage: psql trivia < migrations/0002_question_search_index.sql
+--
+
+CREATE INDEX IF NOT EXISTS ix_questions_search ON public.questions
+    USING gin (to_tsvector('english', coalesce(question, '') || ' ' || coalesce(answer, '')));
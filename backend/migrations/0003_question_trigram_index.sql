@@ -0,0 +1,12 @@
+--
+-- Enables pg_trgm and adds the trigram index used by the trigram search
+-- backend (SEARCH_BACKEND=trigram). Creating the extension needs a role
+-- allowed to do so.
+--
+-- Usage: psql trivia < migrations/0003_question_trigram_index.sql
+--
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS ix_questions_question_trgm ON public.questions
+    USING gin (question gin_trgm_ops);
@@ -0,0 +1,8 @@
+--
+-- Indexes quiz_sessions.created_at, which expired quiz sessions are
+-- deleted by (QUIZ_SESSION_TTL).
+--
+-- Usage: psql trivia < migrations/0004_quiz_session_created_at_index.sql
+--
+
+CREATE INDEX IF NOT EXISTS ix_quiz_sessions_created_at ON public.quiz_sessions (created_at);
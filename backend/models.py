@@ -1,25 +1,54 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+import sys
+import uuid
+import random
+from array import array
+from datetime import datetime, timedelta
+from sqlalchemy import Column, String, Integer, LargeBinary, DateTime, ForeignKey, DDL, create_engine, event, func, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Bundle, deferred
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+from db_pool import pool_options
+from db_replicas import RoutingSession, replica_binds
+
 database_name = 'postgres'
 # database_path = 'postgresql://{}:{}@{}:{}/{}'.format('postgres', '3733', 'localhost','5432', database_name)
 database_path = 'postgresql://postgres:@localhost:5432/postgres'
 
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 """
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    the connection pool is configured from the environment, see db_pool.py
+    replica_paths are read replicas of database_path, see db_replicas.py
 """
-def setup_db(app, database_path=database_path):
+def setup_db(app, database_path=database_path, replica_paths=()):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
+    app.config["SQLALCHEMY_BINDS"] = replica_binds(replica_paths)
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", pool_options(database_path))
     db.app = app
     db.init_app(app)
-    db.create_all()
+
+"""
+init_db()
+    creates the missing tables, backfills the question counters and seeds
+    the data revision.
+    Run once per deployment with `flask init-db`, not on every start, so
+    creating the app never opens a database connection.
+"""
+def init_db():
+    # Replicas copy the primary's schema, only the primary is created.
+    db.create_all(bind_key=None)
+    if QuestionCount.query.first() is None:
+        QuestionCount.rebuild()
+    if DataRevision.query.get(1) is None:
+        db.session.add(DataRevision(id=1, revision=0))
+        db.session.commit()
 
 """
 Question
@@ -31,7 +60,7 @@ class Question(db.Model):
     id = Column(Integer, primary_key=True)
     question = Column(String)
     answer = Column(String)
-    category = Column(String)
+    category = Column(Integer, ForeignKey('categories.id', onupdate='CASCADE', ondelete='SET NULL'), index=True)
     difficulty = Column(Integer)
 
     def __init__(self, question, answer, category, difficulty):
@@ -40,15 +69,27 @@ class Question(db.Model):
         self.category = category
         self.difficulty = difficulty
 
-    def insert(self):
+    def stage(self):
         db.session.add(self)
+        QuestionCount.adjust(self.category, 1)
+
+    def insert(self):
+        self.stage()
         db.session.commit()
 
     def update(self):
+        history = inspect(self).attrs.category.history
+        if history.has_changes():
+            for category in history.deleted:
+                QuestionCount.adjust(category, -1)
+            for category in history.added:
+                QuestionCount.adjust(category, 1)
         db.session.commit()
 
     def delete(self):
+        category = self.category
         db.session.delete(self)
+        QuestionCount.adjust(category, -1)
         db.session.commit()
 
     def format(self):
@@ -60,6 +101,38 @@ class Question(db.Model):
             'difficulty': self.difficulty
             }
 
+"""
+DictBundle
+    a Bundle loaded as a plain dict keyed by its column names.
+"""
+class DictBundle(Bundle):
+    def create_row_processor(self, query, procs, labels):
+        def proc(row):
+            return dict(zip(labels, (getter(row) for getter in procs)))
+        return proc
+
+"""
+FORMATTED_QUESTION
+    selects the columns of Question.format() and loads each row as that
+    dict, without building Question instances or tracking them in the
+    session. Read paths that only serialize questions query this instead:
+        db.session.query(FORMATTED_QUESTION).filter(...)
+        Question.query.filter(...).with_entities(FORMATTED_QUESTION)
+"""
+FORMATTED_QUESTION = DictBundle('question', Question.id, Question.question, Question.answer,
+                                Question.category, Question.difficulty, single_entity=True)
+
+"""
+QUESTION_SEARCH_DOCUMENT
+    the text search vector of a question, built from its question and
+    answer. Queries must use this exact expression to hit the GIN index.
+"""
+QUESTION_SEARCH_DOCUMENT = "to_tsvector('english', coalesce(question, '') || ' ' || coalesce(answer, ''))"
+
+event.listen(Question.__table__, 'after_create', DDL(
+    f"CREATE INDEX IF NOT EXISTS ix_questions_search ON questions USING gin ({QUESTION_SEARCH_DOCUMENT})"
+).execute_if(dialect='postgresql'))
+
 """
 Category
 
@@ -73,8 +146,13 @@ class Category(db.Model):
     def __init__(self, type):
         self.type = type
 
-    def insert(self):
+    def stage(self):
         db.session.add(self)
+        db.session.flush()
+        QuestionCount.adjust(self.id, 0)
+
+    def insert(self):
+        self.stage()
         db.session.commit()
 
     def format(self):
@@ -82,3 +160,168 @@ class Category(db.Model):
             'id': self.id,
             'type': self.type
             }
+
+"""
+UPSERT_INSERTS
+    the INSERT constructs supporting ON CONFLICT DO UPDATE, per dialect.
+"""
+UPSERT_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+"""
+QuestionCount
+    number of questions per category, updated in the same transaction as
+    the question rows so every worker reads the same totals.
+    Questions without a category are counted under category 0.
+    A missing row is created by an upsert, so two workers counting the
+    first question of a category do not both try to insert it.
+"""
+class QuestionCount(db.Model):
+    __tablename__ = 'question_counts'
+
+    category = Column(Integer, primary_key=True, autoincrement=False)
+    total = Column(Integer, nullable=False, default=0)
+
+    @staticmethod
+    def key(category):
+        return int(category) if category not in (None, '') else 0
+
+    @classmethod
+    def adjust(cls, category, delta):
+        key = cls.key(category)
+        insert = UPSERT_INSERTS.get(db.engine.dialect.name)
+        if insert is not None:
+            db.session.execute(insert(cls.__table__).values(category=key, total=max(delta, 0))
+                               .on_conflict_do_update(index_elements=[cls.category],
+                                                      set_={'total': cls.total + delta}))
+            return
+        updated = cls.query.filter_by(category=key).update(
+            {cls.total: cls.total + delta}, synchronize_session=False)
+        if not updated:
+            db.session.add(cls(category=key, total=max(delta, 0)))
+
+    @classmethod
+    def total_for(cls, category=None):
+        if category is None:
+            return db.session.query(func.coalesce(func.sum(cls.total), 0)).scalar()
+        count = cls.query.get(cls.key(category))
+        return count.total if count else 0
+
+    @classmethod
+    def rebuild(cls):
+        cls.query.delete()
+        totals = db.session.query(Question.category, func.count(Question.id)).group_by(Question.category).all()
+        for category, total in totals:
+            db.session.merge(cls(category=cls.key(category), total=total))
+        db.session.commit()
+
+"""
+DataRevision
+    a single row counting the commits that changed questions or
+    categories, shared by every worker. Cached responses are tagged with it.
+"""
+class DataRevision(db.Model):
+    __tablename__ = 'data_revisions'
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    revision = Column(Integer, nullable=False, default=0)
+
+    @classmethod
+    def bump(cls, session):
+        updated = session.query(cls).filter_by(id=1).update(
+            {cls.revision: cls.revision + 1}, synchronize_session=False)
+        if not updated:
+            session.add(cls(id=1, revision=1))
+
+    @classmethod
+    def current(cls):
+        row = cls.query.get(1)
+        return row.revision if row else 0
+
+"""
+QuizSession
+    a quiz game tracked on the server. When the session starts, the ids of
+    the eligible questions are shuffled once into a deck, stored as packed
+    32-bit little endian integers. Every turn reads the id at position and
+    advances it, so questions never repeat and a turn never scans the table.
+    Sessions older than the quiz session TTL are expired and deleted.
+"""
+class QuizSession(db.Model):
+    __tablename__ = 'quiz_sessions'
+
+    id = Column(String(32), primary_key=True)
+    category = Column(Integer, nullable=False, default=0)
+    deck = deferred(Column(LargeBinary, nullable=False, default=b''))
+    size = Column(Integer, nullable=False, default=0)
+    position = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __init__(self, category=0):
+        self.id = uuid.uuid4().hex
+        self.category = category
+        self.position = 0
+
+    def shuffle(self):
+        selection = db.session.query(Question.id)
+        if self.category:
+            selection = selection.filter(Question.category == self.category)
+
+        ids = array('i', [question_id for question_id, in selection])
+        random.shuffle(ids)
+        if sys.byteorder == 'big':
+            ids.byteswap()
+
+        self.deck = ids.tobytes()
+        self.size = len(ids)
+        self.position = 0
+
+    def next_question_id(self):
+        """
+        returns the next id of the deck and advances the session, or None
+        when the deck is exhausted. Only the four bytes of that id are read.
+        """
+        if self.position >= self.size:
+            return None
+
+        chunk = db.session.query(
+            func.substr(QuizSession.deck, self.position * 4 + 1, 4)).filter(
+            QuizSession.id == self.id).scalar()
+        self.position += 1
+
+        ids = array('i', bytes(chunk))
+        if sys.byteorder == 'big':
+            ids.byteswap()
+        return ids[0]
+
+    def expired(self, ttl):
+        return self.created_at < datetime.utcnow() - timedelta(seconds=ttl)
+
+    @classmethod
+    def delete_expired(cls, ttl):
+        """
+        deletes the sessions created more than ttl seconds ago, without
+        committing, and returns how many were deleted.
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=ttl)
+        return cls.query.filter(cls.created_at < cutoff).delete(synchronize_session=False)
+
+    def insert(self):
+        db.session.add(self)
+        db.session.commit()
+
+    def update(self):
+        db.session.commit()
+
+    def delete(self):
+        db.session.delete(self)
+        db.session.commit()
+
+    def format(self):
+        return {
+            'id': self.id,
+            'category': self.category,
+            'served': self.position,
+            'total': self.size
+            }
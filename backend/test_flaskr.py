@@ -1,34 +1,126 @@
 import os
+import shutil
+import tempfile
+import time
 import unittest
+from datetime import datetime, timedelta
 import json
-from flask_sqlalchemy import SQLAlchemy
+import gzip
+from concurrent.futures import Future
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr.category_cache import category_cache
+from flaskr.data_version import data_version
+from flaskr.etag import revision_cache
+from flaskr.replicas import STICKY_COOKIE
+from flaskr.search_cache import search_cache
+from flaskr.search_index import InvertedIndex, search_index
+from flaskr.group_commit import write_queue
+from flaskr.quiz_selector import quiz_selector
+from flaskr.suggest import suggestion_index
+from flaskr.json_provider import json_providers
+from models import db, init_db, Question, Category, DataRevision, QuestionCount, QuizSession, FORMATTED_QUESTION
+
+
+def reset_caches():
+    """Forget what the in-memory caches loaded from another app's database."""
+    for cache in (category_cache, quiz_selector, suggestion_index, search_index, revision_cache):
+        cache.invalidate()
+    search_cache.clear()
+
+
+class ReplicaRoutingTestCase(unittest.TestCase):
+    """Reads routed to a SQLite replica that lags behind its SQLite primary."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        primary = os.path.join(cls.directory, 'primary.db')
+        replica = os.path.join(cls.directory, 'replica.db')
+        cls.app = create_app({
+            'DATABASE_URL': f'sqlite:///{primary}',
+            'DATABASE_REPLICA_URLS': [f'sqlite:///{replica}'],
+        })
+
+        with cls.app.app_context():
+            init_db()
+            Category(type='Science').insert()
+            Question(question='replicated question', answer='replicated answer',
+                     difficulty=1, category=1).insert()
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+        shutil.copyfile(primary, replica)
+        reset_caches()
+
+    @classmethod
+    def tearDownClass(cls):
+        reset_caches()
+        with cls.app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        self.context = self.app.app_context()
+        self.context.push()
+
+    def tearDown(self):
+        self.context.pop()
+
+    def test_reads_go_to_the_replica_until_the_client_writes(self):
+        Question(question='primary only question', answer='primary only answer',
+                 difficulty=1, category=1).insert()
+        client = self.app.test_client()
+
+        data = json.loads(client.get('/questions').data)
+        self.assertEqual(data['total_questions'], 1)
+
+        res = client.post('/questions', json={
+            'question': 'written question', 'answer': 'written answer',
+            'difficulty': 1, 'category': 1})
+        self.assertEqual(res.status_code, 200)
+        self.assertIsNotNone(client.get_cookie(STICKY_COOKIE))
+
+        data = json.loads(client.get('/questions').data)
+        self.assertEqual(data['total_questions'], 3)
+        data = json.loads(self.app.test_client().get('/questions').data)
+        self.assertEqual(data['total_questions'], 1)
+
+    def test_shared_caches_load_from_the_primary(self):
+        writer = self.app.test_client()
+        res = writer.post('/categories', json={'type': 'Written category'})
+        self.assertEqual(res.status_code, 200)
+
+        # Another client misses the cache first, while reading from the replica.
+        self.app.test_client().get('/categories')
+        data = json.loads(writer.get('/categories').data)
+
+        self.assertIn('Written category', data['categories'].values())
 
 
 class TriviaTestCase(unittest.TestCase):
     """This class represents the trivia test case"""
 
-    def setUp(self):
-        """Define test variables and initialize app."""
-        self.app = create_app()
-        self.client = self.app.test_client
-        self.database_name = "trivia_test"
-        self.database_path = 'postgresql://postgres:@localhost:5432/trivia_test'
+    @classmethod
+    def setUpClass(cls):
+        """Create the app and the schema once for the whole test case."""
+        cls.database_name = "trivia_test"
+        cls.database_path = 'postgresql://postgres:@localhost:5432/trivia_test'
+        cls.app = create_app({'DATABASE_URL': cls.database_path})
 
-        setup_db(self.app, self.database_path)
+        with cls.app.app_context():
+            init_db()
 
-        # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            # create all tables
-            self.db.create_all()
+    def setUp(self):
+        """Define test variables and bind the app to the current context."""
+        self.client = self.app.test_client
+        self.context = self.app.app_context()
+        self.context.push()
 
     def tearDown(self):
         """Executed after reach test"""
-        pass
+        self.context.pop()
 
     """
     TODO
@@ -45,6 +137,79 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(len(data['questions']))
         self.assertTrue(data['total_questions'])
 
+    def test_get_compressed_questions(self):
+        res = self.client().get('/questions', headers={'Accept-Encoding': 'gzip'})
+        data = json.loads(gzip.decompress(res.data))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', res.headers['Vary'])
+        self.assertTrue(res.headers['ETag'].endswith('-gzip"'))
+        self.assertTrue(len(data['questions']))
+
+        res = self.client().get('/questions', headers={
+            'Accept-Encoding': 'gzip', 'If-None-Match': res.headers['ETag']})
+        self.assertEqual(res.status_code, 304)
+
+    def test_error_responses_are_not_compressed(self):
+        res = self.client().get('/categories/9999', headers={'Accept-Encoding': 'gzip'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertNotIn('Content-Encoding', res.headers)
+        self.assertEqual(data['success'], False)
+
+    def test_json_providers_agree(self):
+        res = self.client().get('/questions')
+        data = json.loads(res.data)
+
+        data['questions'].append({'id': 0, 'question': 'Où est le Café Müller?',
+                                  'answer': 'Wuppertal ☕', 'category': None, 'difficulty': 1})
+
+        for provider_class in json_providers.values():
+            provider = provider_class(self.app)
+            self.assertEqual(provider.loads(res.data), json.loads(res.data))
+            body = provider.response(data).get_data()
+            self.assertEqual(json.loads(body.decode('utf-8')), data)
+
+    def test_formatted_questions_skip_the_identity_map(self):
+        questions = Question.query.order_by(Question.id).limit(5).with_entities(FORMATTED_QUESTION).all()
+        self.assertEqual(len(db.session.identity_map), 0)
+
+        expected = [question.format() for question in Question.query.order_by(Question.id).limit(5)]
+        self.assertEqual(questions, expected)
+
+    def test_get_questions_page_is_limited(self):
+        res = self.client().get('/questions?page=1')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(len(data['questions']) <= 10)
+        self.assertEqual(data['total_questions'], Question.query.count())
+
+    def test_get_questions_with_cursor(self):
+        res = self.client().get('/questions?after_id=0')
+        data = json.loads(res.data)
+        first_page = [question['id'] for question in data['questions']]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(first_page, sorted(first_page))
+
+        if data['next_cursor']:
+            res = self.client().get(f"/questions?cursor={data['next_cursor']}")
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 200)
+            self.assertTrue(data['questions'][0]['id'] > first_page[-1])
+
+    def test_400_sent_requesting_questions_with_invalid_cursor(self):
+        res = self.client().get('/questions?cursor=not-a-cursor')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'bad request')
+
     def test_404_sent_requesting_questions_beyond_valid_page(self):
         res = self.client().get('/questions?page=1000')
         data = json.loads(res.data)
@@ -61,6 +226,62 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(len(data['categories']))
 
+    def test_store_category_refreshes_categories(self):
+        self.client().get('/categories')
+        res = self.client().post('/categories', json={'type': 'new category'})
+        created = json.loads(res.data)['created']
+
+        data = json.loads(self.client().get('/categories').data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['categories'][str(created)], 'new category')
+
+    def test_conditional_get_categories(self):
+        res = self.client().get('/categories')
+        etag = res.headers['ETag']
+
+        res = self.client().get('/categories', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+        res = self.client().get('/categories', headers={'If-None-Match': f'W/{etag}'})
+        self.assertEqual(res.status_code, 304)
+
+        question = Question(question='etag question', answer='etag answer',
+                            difficulty=1, category=1)
+        question.insert()
+        res = self.client().get('/categories', headers={'If-None-Match': etag})
+        question.delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_conditional_get_categories_written_by_another_worker(self):
+        etag = self.client().get('/categories').headers['ETag']
+
+        # Written without the ORM and without recording the change, like
+        # another worker would, which also bumps the shared revision.
+        result = db.session.execute(Category.__table__.insert().values(type='remote category'))
+        db.session.execute(DataRevision.__table__.update().values(revision=DataRevision.revision + 1))
+        db.session.commit()
+        category_id = result.inserted_primary_key[0]
+
+        ttl = revision_cache.ttl
+        revision_cache.ttl = 0
+        try:
+            res = self.client().get('/categories', headers={'If-None-Match': etag})
+            again = self.client().get('/categories', headers={'If-None-Match': res.headers['ETag']})
+        finally:
+            revision_cache.ttl = ttl
+            db.session.delete(Category.query.get(category_id))
+            db.session.commit()
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+        self.assertEqual(data['categories'][str(category_id)], 'remote category')
+        self.assertEqual(again.status_code, 304)
+
     def test_404_sent_requesting_non_existing_category(self):
         res = self.client().get('/categories/9999')
         data = json.loads(res.data)
@@ -69,6 +290,31 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'resource not found')
 
+    def test_export_questions(self):
+        res = self.client().get('/questions/export?category=1')
+        lines = [json.loads(line) for line in res.data.decode().splitlines()]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertEqual(len(lines), Question.query.filter(Question.category == 1).count())
+        self.assertTrue(all(line['category'] == 1 for line in lines))
+
+    def test_400_export_questions_unknown_format(self):
+        res = self.client().get('/questions/export?format=xml')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(data["message"], "bad request")
+
+    def test_400_export_questions_invalid_filter(self):
+        for query in ('category=abc', 'difficulty=', 'category=1&difficulty=hard'):
+            res = self.client().get(f'/questions/export?{query}')
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(data["message"], "bad request")
+
     def test_delete_question(self):
         question = Question(question='new question', answer='new answer',
                             difficulty=1, category=1)
@@ -86,6 +332,40 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['deleted'], str(question_id))
         self.assertEqual(question, None)
 
+    def test_total_questions_follows_insert_and_delete(self):
+        total_before = json.loads(
+            self.client().get('/categories/1/questions').data)['total_questions']
+
+        question = Question(question='counted question', answer='counted answer',
+                            difficulty=1, category=1)
+        question.insert()
+        data = json.loads(self.client().get('/categories/1/questions').data)
+        self.assertEqual(data['total_questions'], total_before + 1)
+
+        question.delete()
+        data = json.loads(self.client().get('/categories/1/questions').data)
+        self.assertEqual(data['total_questions'], total_before)
+
+    def test_total_questions_of_category_without_counter(self):
+        # Loaded without the ORM, so the category has no question_counts row.
+        result = db.session.execute(Category.__table__.insert().values(type='uncounted category'))
+        db.session.commit()
+        category_id = result.inserted_primary_key[0]
+
+        questions = [Question(question=f'uncounted question {number}', answer='uncounted answer',
+                              difficulty=1, category=category_id) for number in range(2)]
+        for question in questions:
+            question.stage()
+        db.session.commit()
+        total = QuestionCount.total_for(category_id)
+
+        for question in questions:
+            question.delete()
+        db.session.delete(Category.query.get(category_id))
+        db.session.commit()
+
+        self.assertEqual(total, 2)
+
     def test_422_sent_deleting_non_existing_question(self):
         res = self.client().delete('/questions/a')
         data = json.loads(res.data)
@@ -94,6 +374,51 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'unprocessable')
 
+    def test_delete_question_with_expired_quiz_index(self):
+        question = Question(question='stale index question', answer='stale index answer',
+                            difficulty=1, category=1)
+        question.insert()
+        question_id = question.id
+        quiz_selector.ids()
+
+        ttl = quiz_selector.ttl
+        quiz_selector.ttl = 0
+        try:
+            res = self.client().delete(f'/questions/{question_id}')
+        finally:
+            quiz_selector.ttl = ttl
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIsNone(Question.query.get(question_id))
+        self.assertNotIn(question_id, quiz_selector.ids())
+
+    def test_delete_questions_in_bulk(self):
+        questions = [Question(question='doomed question', answer='doomed answer',
+                              difficulty=5, category=1) for _ in range(3)]
+        for question in questions:
+            question.insert()
+        ids = [question.id for question in questions]
+        quiz_selector.ids()
+        total_before = json.loads(self.client().get('/questions').data)['total_questions']
+
+        res = self.client().delete('/questions', json={'ids': ids, 'difficulty': 5})
+        data = json.loads(res.data)
+        total_after = json.loads(self.client().get('/questions').data)['total_questions']
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['deleted'], 3)
+        self.assertEqual(total_after, total_before - 3)
+        for question_id in ids:
+            self.assertNotIn(question_id, quiz_selector.ids())
+
+    def test_422_delete_questions_in_bulk_without_filter(self):
+        res = self.client().delete('/questions', json={})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(data["message"], "unprocessable")
+
     def test_store_question(self):
         new_question = {
             'question': 'new question',
@@ -110,6 +435,93 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["success"], True)
         self.assertEqual(total_questions_after, total_questions_before + 1)
 
+    def test_store_question_with_group_commit(self):
+        self.app.config['GROUP_COMMIT'] = True
+        write_queue.init_app(self.app)
+        try:
+            new_question = {
+                'question': 'grouped question',
+                'answer': 'grouped answer',
+                'difficulty': 1,
+                'category': 1
+            }
+            res = self.client().post('/questions', json=new_question)
+            data = json.loads(res.data)
+        finally:
+            self.app.config['GROUP_COMMIT'] = False
+            write_queue.init_app(self.app)
+
+        question = Question.query.get(data['created'])
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(question.question, 'grouped question')
+        question.delete()
+
+    def test_group_commit_failure_fails_the_waiting_requests(self):
+        def broken_commit(batch):
+            raise RuntimeError('connection lost')
+
+        self.app.config['GROUP_COMMIT'] = True
+        write_queue.init_app(self.app)
+        write_queue._commit = broken_commit
+        try:
+            res = self.client().post('/questions', json={
+                'question': 'lost question', 'answer': 'lost answer', 'difficulty': 1, 'category': 1})
+            del write_queue._commit
+            retry = self.client().post('/questions', json={
+                'question': 'retried question', 'answer': 'retried answer', 'difficulty': 1, 'category': 1})
+        finally:
+            vars(write_queue).pop('_commit', None)
+            self.app.config['GROUP_COMMIT'] = False
+            write_queue.init_app(self.app)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(retry.status_code, 200)
+        Question.query.get(json.loads(retry.data)['created']).delete()
+
+    def test_group_commit_failure_keeps_the_indexes(self):
+        def broken_commit():
+            raise RuntimeError('connection lost')
+
+        ids = list(quiz_selector.ids())
+        version = data_version.value
+        future = Future()
+        session = db.session()
+        session.commit = broken_commit
+        try:
+            write_queue._commit([(Question(question='rolled back question', answer='rolled back answer',
+                                           difficulty=1, category=1), future)])
+        finally:
+            del session.commit
+
+        self.assertIsInstance(future.exception(), RuntimeError)
+        self.assertEqual(data_version.value, version)
+        self.assertEqual(list(quiz_selector.ids()), ids)
+
+    def test_503_group_commit_timeout(self):
+        commit = write_queue._commit
+        timeout = self.app.config['GROUP_COMMIT_TIMEOUT']
+
+        def slow_commit(batch):
+            time.sleep(0.2)
+            commit(batch)
+
+        self.app.config.update(GROUP_COMMIT=True, GROUP_COMMIT_TIMEOUT=0.05)
+        write_queue.init_app(self.app)
+        write_queue._commit = slow_commit
+        try:
+            res = self.client().post('/questions', json={
+                'question': 'late question', 'answer': 'late answer', 'difficulty': 1, 'category': 1})
+            time.sleep(0.3)
+        finally:
+            del write_queue._commit
+            self.app.config.update(GROUP_COMMIT=False, GROUP_COMMIT_TIMEOUT=timeout)
+            write_queue.init_app(self.app)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(data['message'], 'service unavailable')
+        self.assertEqual(Question.query.filter(Question.question == 'late question').count(), 0)
+
     def test_422_add_question(self):
         new_question = {
             'question': 'new_question',
@@ -123,6 +535,31 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["success"], False)
         self.assertEqual(data["message"], "unprocessable")
 
+    def test_import_questions_in_bulk(self):
+        total_questions_before = Question.query.count()
+        new_questions = [
+            {'question': 'bulk question', 'answer': 'bulk answer', 'difficulty': 1, 'category': 1},
+            {'question': 'bulk question', 'answer': 'bulk answer', 'difficulty': 1, 'category': 9999},
+            {'question': 'bulk question', 'answer': 'bulk answer', 'category': 1},
+        ]
+        res = self.client().post('/questions/bulk', json=new_questions)
+        data = json.loads(res.data)
+        for question in Question.query.filter(Question.question == 'bulk question').all():
+            question.delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['created'], 1)
+        self.assertEqual([error['row'] for error in data['errors']], [2, 3])
+        self.assertEqual(Question.query.count(), total_questions_before)
+
+    def test_400_import_questions_unsupported_format(self):
+        res = self.client().post('/questions/bulk', data='questions', content_type='text/plain')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(data["message"], "bad request")
+
     def test_search_questions(self):
         new_search = {'searchTerm': 'a'}
         res = self.client().post('/questions/search', json=new_search)
@@ -133,6 +570,82 @@ class TriviaTestCase(unittest.TestCase):
         self.assertIsNotNone(data['total_questions'])
         self.assertIsNotNone(data['questions'])
 
+    def test_search_questions_page(self):
+        res = self.client().post('/questions/search', json={'searchTerm': 'a', 'page': 1})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(len(data['questions']) <= 10)
+        self.assertTrue(data['total_questions'] >= len(data['questions']))
+
+    def test_memory_search_index(self):
+        index = InvertedIndex()
+        index.add({'id': 1, 'question': 'Who discovered penicillin?', 'answer': 'Alexander Fleming'})
+        index.add({'id': 2, 'question': 'Who invented Peanut Butter?', 'answer': 'George Washington Carver'})
+
+        self.assertEqual(set(index.search('who')), {1, 2})
+        self.assertEqual(set(index.search('penic')), {1})
+
+        index.remove({'id': 1, 'question': 'Who discovered penicillin?', 'answer': 'Alexander Fleming'})
+        self.assertEqual(index.search('penicillin'), {})
+
+    def test_search_index_rebuilds_after_ttl(self):
+        index = InvertedIndex(ttl=0)
+        index.ensure_built()
+
+        # Written without the ORM and without recording the change, like
+        # another process would.
+        result = db.session.execute(Question.__table__.insert().values(
+            question='Which metal is liquid at room temperature?', answer='Quicksilver',
+            difficulty=1, category=1))
+        db.session.commit()
+        question_id = result.inserted_primary_key[0]
+
+        index.ensure_built()
+        found = index.search('quicksilver')
+        Question.query.get(question_id).delete()
+
+        self.assertIn(question_id, found)
+
+    def test_search_questions_limit_is_bounded(self):
+        res = self.client().post('/questions/search', json={'searchTerm': 'a', 'limit': 100000})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(len(data['questions']) <= self.app.config['SEARCH_MAX_PAGE_SIZE'])
+        self.assertIn('total_questions_estimated', data)
+
+    def test_search_cache_is_invalidated_by_writes(self):
+        new_search = {'searchTerm': 'cached search question'}
+        data = json.loads(self.client().post('/questions/search', json=new_search).data)
+        total_before = data['total_questions']
+
+        question = Question(question='Cached search question?', answer='answer',
+                            difficulty=1, category=1)
+        question.insert()
+        data = json.loads(self.client().post('/questions/search', json=new_search).data)
+        question.delete()
+
+        self.assertEqual(data['total_questions'], total_before + 1)
+
+    def test_get_metrics(self):
+        res = self.client().get('/metrics')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'trivia_search_cache_hits_total', res.data)
+        self.assertIn(b'trivia_db_pool_checked_out', res.data)
+        self.assertIn(b'trivia_db_pool_wait_seconds_count', res.data)
+
+    def test_search_questions_with_number(self):
+        res = self.client().post('/questions/search', json={'searchTerm': 1990})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+
+        res = self.client().post('/questions/search', json={'searchTerm': ['title']})
+        self.assertEqual(res.status_code, 400)
+
     def test_404_search_question(self):
         new_search = {
             'searchTerm': '',
@@ -144,6 +657,44 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["success"], False)
         self.assertEqual(data["message"], "resource not found")
 
+    def test_suggest_questions(self):
+        question = Question(question='Suggested question stem?', answer='answer',
+                            difficulty=1, category=1)
+        question.insert()
+
+        res = self.client().get('/questions/suggest?prefix=suggested QUESTION')
+        data = json.loads(res.data)
+        question.delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertIn(question.id, [suggestion['id'] for suggestion in data['suggestions']])
+
+    def test_suggest_questions_while_the_index_reloads(self):
+        expected = suggestion_index.suggest('', 5)
+        entry = suggestion_index._entry
+
+        # Another request is reloading the expired index.
+        ttl = suggestion_index.ttl
+        suggestion_index.ttl = 0
+        suggestion_index._build_lock.acquire()
+        try:
+            suggestions = suggestion_index.suggest('', 5)
+        finally:
+            suggestion_index._build_lock.release()
+            suggestion_index.ttl = ttl
+
+        self.assertEqual(suggestions, expected)
+        self.assertIs(suggestion_index._entry, entry)
+
+    def test_422_suggest_questions_without_prefix(self):
+        res = self.client().get('/questions/suggest')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(data["message"], "unprocessable")
+
     def test_get_questions_per_category(self):
         res = self.client().get('/categories/1/questions')
         data = json.loads(res.data)
@@ -172,6 +723,38 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertEqual(data['success'], True)
 
+    def test_quiz_index_with_uncategorized_question(self):
+        question = Question(question='uncategorized question', answer='uncategorized answer',
+                            difficulty=1, category=None)
+        question.insert()
+        quiz_selector.invalidate()
+        listed = list(quiz_selector.ids()).count(question.id)
+
+        question.category = 1
+        question.update()
+        moved = list(quiz_selector.ids()).count(question.id)
+        in_category = question.id in quiz_selector.ids(1)
+        question.delete()
+
+        self.assertEqual(listed, 1)
+        self.assertEqual(moved, 1)
+        self.assertTrue(in_category)
+
+    def test_play_quiz_while_the_index_reloads(self):
+        ids = quiz_selector.ids()
+
+        # Another request is reloading the expired index.
+        ttl = quiz_selector.ttl
+        quiz_selector.ttl = 0
+        quiz_selector._build_lock.acquire()
+        try:
+            stale = quiz_selector.ids()
+        finally:
+            quiz_selector._build_lock.release()
+            quiz_selector.ttl = ttl
+
+        self.assertIs(stale, ids)
+
     def test_404_play_quiz(self):
         new_quiz_round = {'previous_questions': []}
         res = self.client().post('/quizzes', json=new_quiz_round)
@@ -182,6 +765,67 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["message"], "unprocessable")
 
 
+    def test_play_quiz_session(self):
+        res = self.client().post('/quizzes/sessions',
+                                 json={'quiz_category': {'type': 'Science', 'id': 1}})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        session_id = data['session_id']
+
+        served = []
+        while True:
+            res = self.client().post(f'/quizzes/sessions/{session_id}/next')
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            if data['question'] is None:
+                break
+            self.assertEqual(data['question']['category'], 1)
+            served.append(data['question']['id'])
+
+        self.assertTrue(len(served))
+        self.assertEqual(len(served), len(set(served)))
+
+        res = self.client().delete(f'/quizzes/sessions/{session_id}')
+        self.assertEqual(res.status_code, 200)
+
+    def test_quiz_sessions_have_independent_decks(self):
+        first = json.loads(self.client().post(
+            '/quizzes/sessions', json={'quiz_category': {'id': 1}}).data)['session_id']
+        second = json.loads(self.client().post(
+            '/quizzes/sessions', json={'quiz_category': {'id': 1}}).data)['session_id']
+
+        self.client().post(f'/quizzes/sessions/{first}/next')
+        data = json.loads(self.client().post(f'/quizzes/sessions/{second}/next').data)
+
+        self.assertEqual(data['served'], 1)
+        self.assertEqual(data['total'], Question.query.filter(Question.category == 1).count())
+
+    def test_expired_quiz_session(self):
+        res = self.client().post('/quizzes/sessions', json={'quiz_category': {'id': 1}})
+        session_id = json.loads(res.data)['session_id']
+
+        session = QuizSession.query.get(session_id)
+        session.created_at = datetime.utcnow() - timedelta(seconds=self.app.config['QUIZ_SESSION_TTL'] + 60)
+        session.update()
+
+        res = self.client().post(f'/quizzes/sessions/{session_id}/next')
+        self.assertEqual(res.status_code, 404)
+
+        res = self.client().post('/quizzes/sessions', json={'quiz_category': {'id': 1}})
+        db.session.expire_all()
+        self.assertIsNone(QuizSession.query.get(session_id))
+        self.client().delete(f"/quizzes/sessions/{json.loads(res.data)['session_id']}")
+
+    def test_404_quiz_session_not_found(self):
+        res = self.client().post('/quizzes/sessions/unknown/next')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(data["message"], "resource not found")
+
 # Make the tests conveniently executable
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file